@@ -0,0 +1,550 @@
+import posixpath
+import hashlib
+import html
+import json
+import re
+import io
+import os
+
+try:
+    from fontTools import subset as fontSubset
+    from fontTools.ttLib import TTFont
+except ImportError:
+    fontSubset = None
+
+import compression
+
+"""
+    Build step for the files under static/.
+
+    buildAssets() copies every static asset into static/build/ under a name that carries a hash of its
+    contents (css/styles.min.css -> build/css/styles.min.1a2b3c4d5e.css) and writes a manifest mapping
+    the original names to the hashed ones. url() references inside stylesheets are rewritten to the
+    hashed names of the files they point at, so a stylesheet's hash also changes when a font or image
+    it uses does. Because a hashed file never changes, it can be cached by browsers for a year.
+    Text assets also get precompressed .br/.gz siblings (see compression.py).
+
+    Profile photos are uploaded at runtime and are left out.
+
+    buildBundles() then joins the stylesheets and the scripts each page template lists inside a
+    {% call bundle('<page>.css') %} / {% call bundle('<page>.js') %} block into one file per page
+    (build/bundles/). Rules whose class or id selectors never appear in that page's markup are
+    dropped: the template, the partials, the markup generated in flask_app.py and the page's own
+    scripts (which add classes such as "show" at runtime). Rules repeated across files are kept once,
+    and the stylesheets' @import rules are hoisted to the top, minus those the page links itself.
+    flask_app.bundle() puts the single <link>/<script> tag in place of the block once it is built.
+
+    Templates with a {# fold #} marker also get critical/<page>.css: the rules of their stylesheet bundle that
+    the markup above the marker needs, with url()s relative to static/ so the page can inline it.
+
+    The icon fonts are cut down first (subsetIcons()): each stylesheet in ICON_STYLESHEETS keeps only the
+    icon classes found in the templates, flask_app.py and the scripts the templates link, and its WOFF2
+    fonts only the glyphs of those classes. The trimmed files take the place of the originals in the manifest,
+    so the templates' links and the bundles use them without further changes. Browsers too old for WOFF2 get
+    no icons. This needs the fontTools and brotli packages; without them the fonts are left whole (see missingPackages()).
+"""
+
+BUILD_DIRECTORY = "build"
+MANIFEST_NAME = "manifest.json"
+
+# Directories under static/ that are not part of the build.
+EXCLUDED = {BUILD_DIRECTORY, "images/Faculty", "images/JPL", "images/Students"}
+
+HASH_LENGTH = 10
+
+BUNDLE_DIRECTORY = "bundles"
+
+# A {% call bundle('name') %} ... {% endcall %} block in a template, and the static files it lists.
+BUNDLE_PATTERN = re.compile(r"""{%-?\s*call\s+bundle\(\s*['"]([^'"]+)['"]\s*\)\s*-?%}(.*?){%-?\s*endcall\s*-?%}""", re.S)
+STATIC_PATTERN = re.compile(r"""url_for\(\s*['"]static['"]\s*,\s*filename\s*=\s*['"]([^'"]+)['"]""")
+
+# Words of the markup a page is built from; a class or id selector is kept when all its names are among them.
+TOKEN_PATTERN = re.compile(r"[\w-]+")
+SELECTOR_NAME_PATTERN = re.compile(r"[.#]((?:\\.|[\w-])+)")
+ATTRIBUTE_PATTERN = re.compile(r"""\[\s*([\w-]+)\s*(?:([~|]?=)\s*(?:"([^"]*)"|'([^']*)'|([\w-]+))\s*[is]?\s*)?\]""")
+
+# At-rules whose bodies are lists of rules, purged like the top level. Others (@font-face, @keyframes) are kept whole.
+NESTED_AT_RULES = {"@media", "@supports", "@container", "@layer", "@document", "@-moz-document"}
+
+SOURCE_MAP_PATTERN = re.compile(r"^\s*(//[#@]\s*sourceMappingURL=.*|/\*[#@]\s*sourceMappingURL=.*?\*/)\s*$", re.M)
+
+# Ends the part of a page template shown on first paint. The rules that part needs are written to
+# critical/<page>.css, which flask_app.bundle() inlines before loading the whole bundle without blocking.
+FOLD_MARKER = "{# fold #}"
+CRITICAL_DIRECTORY = "critical"
+
+# Icon font stylesheets whose fonts are subset to the icons in use, and the parts of their glyph rules.
+ICON_STYLESHEETS = ("fonts/font-awesome.min.css", "fonts/fontawesome-all.min.css", "fonts/line-awesome.min.css")
+GLYPH_SELECTOR_PATTERN = re.compile(r"\.([\w-]+)::?before")
+CONTENT_PATTERN = re.compile(r"""content\s*:\s*(["'])(\\[0-9a-fA-F]{1,6}\s?|[^"'\\])\1""")
+FONT_FACE_PATTERN = re.compile(r"@font-face\s*{([^}]*)}")
+
+URL_PATTERN = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def hashedName(path, digest):
+    """
+    Inserts the content digest before the extension: css/site.css -> css/site.<digest>.css
+    """
+    stem, extension = posixpath.splitext(path)
+    return "%s.%s%s" % (stem, digest[:HASH_LENGTH], extension)
+
+
+def listAssets(staticFolder):
+    """
+    Returns the paths, relative to staticFolder and using forward slashes, of the files to fingerprint.
+    """
+    assets = []
+    for root, directories, files in os.walk(staticFolder):
+        relative = os.path.relpath(root, staticFolder).replace(os.sep, "/")
+        relative = "" if relative == "." else relative + "/"
+        directories[:] = sorted(d for d in directories if relative + d not in EXCLUDED)
+        for name in sorted(files):
+            if not name.startswith(".") and not name.endswith((".gz", ".br", ".part")):
+                assets.append(relative + name)
+    return assets
+
+
+def rewriteUrls(css, path, manifest, location=None):
+    """
+    Points relative url() references in the stylesheet at path to the hashed names in manifest.
+    Query strings and fragments (font cache busters, #iefix, SVG ids) are kept. location is the directory,
+    relative to static/, the rewritten stylesheet is served from; by default the hashed copy's directory.
+    """
+    directory = posixpath.dirname(path)
+    if location is None:
+        location = posixpath.join(BUILD_DIRECTORY, directory) if directory else BUILD_DIRECTORY
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(("data:", "http:", "https:", "//", "/", "#")):
+            return match.group(0)
+        target, suffix = re.match(r"([^?#]*)(.*)", url).groups()
+        resolved = posixpath.normpath(posixpath.join(directory, target))
+        if resolved not in manifest:
+            return match.group(0)
+        hashed = posixpath.relpath(manifest[resolved], location)
+        return "url(%s%s%s%s)" % (quote, hashed, suffix, quote)
+
+    return URL_PATTERN.sub(replace, css)
+
+
+def writeHashed(staticFolder, path, content):
+    """
+    Writes content to the fingerprinted name of path under staticFolder/build, with its precompressed siblings,
+    unless it is there already. Returns the hashed path, relative to staticFolder.
+    """
+    hashed = posixpath.join(BUILD_DIRECTORY, hashedName(path, hashlib.sha256(content).hexdigest()))
+    destination = os.path.join(staticFolder, *hashed.split("/"))
+    if not os.path.exists(destination):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with open(destination + ".part", "wb") as file:
+            file.write(content)
+        os.replace(destination + ".part", destination)
+    if destination.endswith(compression.COMPRESSIBLE_EXTENSIONS) and not all(os.path.exists(destination + suffix) for suffix in compression.ENCODINGS.values()):
+        compression.precompress(destination)
+    return hashed
+
+
+def buildAssets(staticFolder, templateFolder=None, markupSources=()):
+    """
+    Writes the fingerprinted copies of the static assets and their manifest into staticFolder/build.
+    With templateFolder, also writes the page bundles (see buildBundles). Returns the manifest, which maps
+    each original path to its hashed path (both relative to staticFolder).
+    """
+    manifest = {}
+    assets = listAssets(staticFolder)
+    replaced = subsetIcons(staticFolder, siteMarkup(staticFolder, templateFolder, markupSources)) if templateFolder and not missingPackages() else {}
+
+    # Stylesheets go last so the files they reference already have their hashed names.
+    for path in sorted(assets, key=lambda path: path.endswith(".css")):
+        if path in replaced:
+            content = replaced[path]
+            content = content.encode("utf-8", "surrogateescape") if isinstance(content, str) else content
+        else:
+            with open(os.path.join(staticFolder, path), "rb") as file:
+                content = file.read()
+        if path.endswith(".css"):
+            content = rewriteUrls(content.decode("utf-8", "surrogateescape"), path, manifest).encode("utf-8", "surrogateescape")
+
+        manifest[path] = writeHashed(staticFolder, path, content)
+
+    if templateFolder:
+        buildBundles(staticFolder, templateFolder, manifest, markupSources, replaced)
+
+    manifestPath = os.path.join(staticFolder, BUILD_DIRECTORY, MANIFEST_NAME)
+    os.makedirs(os.path.dirname(manifestPath), exist_ok=True)
+    with open(manifestPath + ".part", "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(manifestPath + ".part", manifestPath)
+    return manifest
+
+
+def findBundles(templateFolder):
+    """
+    Returns {bundle name: (template file, [static paths])} for the bundle blocks in the page templates.
+    Files from other hosts stay outside the bundles.
+    """
+    bundles = {}
+    for name in sorted(os.listdir(templateFolder)):
+        path = os.path.join(templateFolder, name)
+        if not name.endswith(".html") or not os.path.isfile(path):
+            continue
+        with open(path, encoding="utf-8") as file:
+            for bundle, block in BUNDLE_PATTERN.findall(file.read()):
+                sources = [source for source in STATIC_PATTERN.findall(block) if "//" not in source]
+                bundles[bundle] = (path, sources)
+    return bundles
+
+
+def buildBundles(staticFolder, templateFolder, manifest, markupSources=(), replaced={}):
+    """
+    Writes one stylesheet and one script per page template into staticFolder/build/bundles and adds them to
+    manifest as bundles/<name>. markupSources are other files whose markup ends up in the pages; replaced
+    maps the stylesheets subsetIcons() trimmed to their new text.
+    """
+    bundles = findBundles(templateFolder)
+    shared = list(markupSources)
+    partials = os.path.join(templateFolder, "partials")
+    if os.path.isdir(partials):
+        shared += [os.path.join(partials, name) for name in sorted(os.listdir(partials))]
+    sharedText = "".join(readText(path) for path in shared)
+
+    for name, (template, sources) in sorted(bundles.items()):
+        texts = [replaced.get(source) or readText(os.path.join(staticFolder, *source.split("/"))) for source in sources]
+        location = posixpath.join(BUILD_DIRECTORY, BUNDLE_DIRECTORY)
+        if name.endswith(".css"):
+            page = readText(template)
+            scripts = [source for bundle, (other, paths) in bundles.items() if other == template and bundle.endswith(".js") for source in paths]
+            markup = page + sharedText + "".join(readText(os.path.join(staticFolder, *source.split("/"))) for source in scripts)
+            stylesheets = [rewriteUrls(text, source, manifest, location) for source, text in zip(sources, texts)]
+            content = bundleStylesheets(stylesheets, set(TOKEN_PATTERN.findall(markup)), html.unescape(page))
+            if FOLD_MARKER in page:
+                stylesheets = [rewriteUrls(text, source, manifest, ".") for source, text in zip(sources, texts)]
+                critical = bundleStylesheets(stylesheets, set(TOKEN_PATTERN.findall(page[:page.index(FOLD_MARKER)])), html.unescape(page))
+                path = posixpath.join(CRITICAL_DIRECTORY, name)
+                manifest[path] = writeHashed(staticFolder, path, critical.encode("utf-8"))
+        else:
+            content = "".join(SOURCE_MAP_PATTERN.sub("", text).rstrip() + "\n;\n" for text in texts)
+        manifest[posixpath.join(BUNDLE_DIRECTORY, name)] = writeHashed(staticFolder, posixpath.join(BUNDLE_DIRECTORY, name), content.encode("utf-8"))
+    return bundles
+
+
+def siteMarkup(staticFolder, templateFolder, markupSources=()):
+    """
+    Returns the text everything the pages show is made from: every template, the markupSources, and the
+    local scripts the templates link.
+    """
+    paths, scripts = list(markupSources), []
+    for directory, _, names in sorted(os.walk(templateFolder)):
+        for name in sorted(names):
+            if name.endswith(".html"):
+                path = os.path.join(directory, name)
+                paths.append(path)
+                scripts += [source for source in STATIC_PATTERN.findall(readText(path)) if source.endswith(".js") and "//" not in source]
+    paths += [os.path.join(staticFolder, *source.split("/")) for source in dict.fromkeys(scripts)]
+    return "".join(readText(path) for path in paths if os.path.isfile(path))
+
+
+def missingPackages():
+    """
+    Returns the names of the packages subsetIcons() needs that are not installed.
+    """
+    return [name for name, module in (("fonttools", fontSubset), ("brotli", compression.brotli)) if module is None]
+
+
+def subsetIcons(staticFolder, markup):
+    """
+    Trims the stylesheets in ICON_STYLESHEETS to the icon classes that appear in markup, with a WOFF2-only
+    @font-face, and subsets their WOFF2 fonts to the glyphs of those classes. Returns {path: new content}:
+    text for the stylesheets, bytes for the fonts. Raises RuntimeError when fontTools or brotli is not installed.
+    """
+    missing = missingPackages()
+    if missing:
+        raise RuntimeError("Subsetting the icon fonts needs %s" % " and ".join(missing))
+    used = set(TOKEN_PATTERN.findall(markup))
+    replaced = {}
+    for path in ICON_STYLESHEETS:
+        source = os.path.join(staticFolder, *path.split("/"))
+        if not os.path.isfile(source):
+            continue
+        css = readText(source)
+
+        codepoints = set()
+        for prelude, body in styleRules(splitCss(css)[0]):
+            content = CONTENT_PATTERN.search(body)
+            if content is None:
+                continue
+            for selector in splitSelectors(prelude):
+                glyph = GLYPH_SELECTOR_PATTERN.fullmatch(selector)
+                if glyph and glyph.group(1) in used:
+                    value = content.group(2)
+                    codepoints.add(int(value[1:], 16) if value.startswith("\\") else ord(value))
+
+        def fontFace(match):
+            declarations = [declaration.strip() for declaration in re.split(r";(?![^(]*\))", match.group(1)) if declaration.strip()]
+            sources = [url for declaration in declarations if declaration.lower().startswith("src") for _, url in URL_PATTERN.findall(declaration)]
+            woff2 = next((re.split(r"[?#]", url)[0] for url in sources if re.split(r"[?#]", url)[0].endswith(".woff2")), None)
+            if woff2 is None:
+                return ""
+            font = posixpath.normpath(posixpath.join(posixpath.dirname(path), woff2))
+            if font not in replaced:
+                replaced[font] = subsetFont(os.path.join(staticFolder, *font.split("/")), codepoints)
+            kept = [declaration for declaration in declarations if not declaration.lower().startswith("src")]
+            return '@font-face{%s;src:url(%s) format("woff2")}' % (";".join(kept), woff2)
+
+        replaced[path] = bundleStylesheets([FONT_FACE_PATTERN.sub(fontFace, css)], used)
+    return replaced
+
+
+def styleRules(statements):
+    """
+    Yields the (selectors, declarations) of the style rules in statements, including those nested in @media and the like.
+    """
+    for prelude, body in statements:
+        keyword = atKeyword(prelude)
+        if keyword in NESTED_AT_RULES:
+            yield from styleRules(splitCss(body)[0])
+        elif body is not None and not keyword:
+            yield prelude, body
+
+
+def subsetFont(path, codepoints):
+    """
+    Returns the font at path as WOFF2 holding only the glyphs of codepoints.
+    """
+    options = fontSubset.Options()
+    options.flavor = "woff2"
+    options.drop_tables += ["FFTM"]
+    font = TTFont(path)
+    subsetter = fontSubset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    buffer = io.BytesIO()
+    font.save(buffer)
+    return buffer.getvalue()
+
+
+def readText(path):
+    with open(path, encoding="utf-8", errors="surrogateescape") as file:
+        return file.read()
+
+
+def bundleStylesheets(stylesheets, used, page=""):
+    """
+    Joins the stylesheets into one, keeping only the rules whose class and id names are all in used.
+    Identical rules are kept once (the last, which is the one that wins), @import rules are hoisted to
+    the top and dropped when page already links their URL, and @keyframes and @font-face rules nobody refers
+    to are dropped.
+    License comments (/*! ... */) are kept at the top.
+    """
+    statements, licenses = [], []
+    for css in stylesheets:
+        parsed, comments = splitCss(css)
+        statements += parsed
+        licenses += comments
+
+    imports, charset, rules = [], None, []
+    for prelude, body in statements:
+        keyword = atKeyword(prelude)
+        if keyword == "@charset":
+            charset = prelude
+        elif keyword == "@import":
+            url = re.sub(r"""^@import\s+(url\()?\s*['"]?|['"]?\s*\)?\s*$""", "", prelude)
+            if prelude not in imports and url not in page:
+                imports.append(prelude)
+        else:
+            rules.append((prelude, body))
+
+    rules = purgeRules(rules, used)
+    referenced = set(TOKEN_PATTERN.findall(joinCss([rule for rule in rules if not atKeyword(rule[0]).endswith("keyframes")])))
+    rules = [rule for rule in rules if not atKeyword(rule[0]).endswith("keyframes") or rule[0].split()[-1] in referenced]
+    styles = joinCss([rule for rule in rules if atKeyword(rule[0]) != "@font-face"]).lower()
+    rules = [rule for rule in rules if atKeyword(rule[0]) != "@font-face" or fontFamily(rule[1]) in styles]
+
+    head = ([charset + ";"] if charset else []) + [comment + "\n" for comment in dict.fromkeys(licenses)]
+    return "".join(head) + joinCss([(prelude, None) for prelude in imports] + rules) + "\n"
+
+
+def fontFamily(declarations):
+    """
+    Returns the lower-cased family name an @font-face rule declares, without quotes.
+    """
+    match = re.search(r"font-family\s*:\s*([^;]+)", declarations or "")
+    return match.group(1).strip().strip("\"'").lower() if match else ""
+
+
+def splitCss(css):
+    """
+    Splits a stylesheet into its top-level statements: (prelude, body) pairs, where body is None for
+    statements that end in ";" (@import, @charset) and the text between the braces otherwise.
+    Comments are dropped; /*! license comments */ at the top level are returned separately.
+    """
+    statements, licenses, pieces = [], [], []
+    depth = start = index = 0
+    prelude = None
+    while index < len(css):
+        character = css[index]
+        if css.startswith("/*", index):
+            end = css.find("*/", index + 2)
+            end = len(css) if end < 0 else end + 2
+            if depth == 0 and css.startswith("/*!", index):
+                licenses.append(css[index:end])
+            pieces.append(css[start:index])
+            start = index = end
+            continue
+        if character in "\"'":
+            index = skipString(css, index)
+            continue
+        if character == "\\":
+            index += 2
+            continue
+        if character == "{":
+            if depth == 0:
+                pieces.append(css[start:index])
+                prelude, pieces, start = "".join(pieces).strip(), [], index + 1
+            depth += 1
+        elif character == "}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                pieces.append(css[start:index])
+                statements.append((prelude, "".join(pieces).strip()))
+                pieces, start = [], index + 1
+        elif character == ";" and depth == 0:
+            pieces.append(css[start:index])
+            statement = "".join(pieces).strip()
+            if statement:
+                statements.append((statement, None))
+            pieces, start = [], index + 1
+        index += 1
+    return statements, licenses
+
+
+def skipString(text, index):
+    """
+    Returns the index just past the quoted string starting at index.
+    """
+    quote = text[index]
+    index += 1
+    while index < len(text) and text[index] != quote:
+        index += 2 if text[index] == "\\" else 1
+    return index + 1
+
+
+def atKeyword(prelude):
+    match = re.match(r"@[\w-]+", prelude)
+    return match.group(0).lower() if match else ""
+
+
+def purgeRules(statements, used):
+    """
+    Drops the selectors that name a class or id not in used, and the rules and nested blocks left empty.
+    Of identical rules only the last is kept.
+    """
+    kept = []
+    for prelude, body in statements:
+        keyword = atKeyword(prelude)
+        if body is None or (keyword and keyword not in NESTED_AT_RULES):
+            kept.append((prelude, body))
+        elif keyword:
+            inner = purgeRules(splitCss(body)[0] if isinstance(body, str) else body, used)
+            if inner:
+                kept.append((prelude, inner))
+        else:
+            selectors = [selector for selector in splitSelectors(prelude) if selectorUsed(selector, used)]
+            if selectors and body:
+                kept.append((",".join(selectors), body))
+
+    seen, unique = set(), []
+    for statement in reversed(kept):
+        text = joinCss([statement])
+        if text not in seen:
+            seen.add(text)
+            unique.append(statement)
+    return unique[::-1]
+
+
+def splitSelectors(prelude):
+    """
+    Splits a selector list at the commas that are not inside parentheses, brackets or strings.
+    """
+    selectors, depth, start, index = [], 0, 0, 0
+    while index < len(prelude):
+        character = prelude[index]
+        if character in "\"'":
+            index = skipString(prelude, index)
+            continue
+        if character in "([":
+            depth += 1
+        elif character in ")]":
+            depth -= 1
+        elif character == "," and depth == 0:
+            selectors.append(prelude[start:index].strip())
+            start = index + 1
+        index += 1
+    selectors.append(prelude[start:].strip())
+    return [selector for selector in selectors if selector]
+
+
+def selectorUsed(selector, used):
+    """
+    Tells whether every class and id the selector requires is in used, as well as the attribute names and the
+    values matched with = or ~= (e.g. [data-aos=fade-up]). Names inside :not(), :is() and other functional
+    pseudo-classes do not count; escaped names are assumed used.
+    """
+    outer, depth = [], 0
+    for character in selector:
+        if character == "(":
+            depth += 1
+        elif character == ")":
+            depth -= 1
+        elif depth == 0:
+            outer.append(character)
+    outer = "".join(outer)
+    for name, operator, *values in ATTRIBUTE_PATTERN.findall(outer):
+        value = "".join(values)
+        if name not in used or (operator in ("=", "~=") and not all(word in used for word in TOKEN_PATTERN.findall(value))):
+            return False
+    outer = re.sub(r"\[[^\]]*\]", "", outer)
+    return all("\\" in name or name in used for name in SELECTOR_NAME_PATTERN.findall(outer))
+
+
+def joinCss(statements):
+    parts = []
+    for prelude, body in statements:
+        if body is None:
+            parts.append(prelude + ";")
+        elif isinstance(body, list):
+            parts.append("%s{%s}" % (prelude, joinCss(body)))
+        else:
+            parts.append("%s{%s}" % (prelude, body))
+    return "".join(parts)
+
+
+def loadCritical(staticFolder, manifest):
+    """
+    Returns {bundle name: (critical CSS, [paths of the WOFF2 fonts it uses])} for the critical stylesheets in
+    manifest. Paths, like the CSS's url()s, are relative to staticFolder.
+    """
+    styles = {}
+    for path, hashed in manifest.items():
+        if posixpath.dirname(path) != CRITICAL_DIRECTORY:
+            continue
+        try:
+            css = readText(os.path.join(staticFolder, *hashed.split("/")))
+        except OSError:
+            continue
+        fonts = [url for _, url in URL_PATTERN.findall(css) if url.endswith(".woff2")]
+        styles[posixpath.basename(path)] = (css, list(dict.fromkeys(fonts)))
+    return styles
+
+
+def loadManifest(staticFolder):
+    """
+    Returns the manifest written by the last buildAssets(), or an empty dict if the assets were never built.
+    """
+    try:
+        with open(os.path.join(staticFolder, BUILD_DIRECTORY, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
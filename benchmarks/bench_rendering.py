@@ -0,0 +1,120 @@
+"""
+    Compares the old chained str.replace() row assembly with the Jinja macros in
+    templates/partials/profiles.html at 10, 1k and 50k rows.
+
+    Usage: python benchmarks/bench_rendering.py [--sizes 10 1000 50000] [--repeat 3]
+
+    The replace() chain appends to a Markup string, so its cost grows with the square of the row
+    count. Once a size would take longer than --budget seconds the legacy column is skipped.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from markupsafe import Markup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask_app import app, renderProfiles
+
+
+def syntheticFaculty(count):
+    return [(i, f"Dr. Person {i}", "Professor of Computer Science", "Fayetteville State University (FSU)",
+             f"person{i}@uncfsu.edu", "Researches machine learning and robotics. " * 20, f"person{i}.jpg",
+             f"https://example.edu/person{i}", "copi") for i in range(1, count + 1)]
+
+
+def syntheticStudents(count):
+    return [(i, f"Student {i}", "Senior", f"student{i}.jpg", "FSU", f"student{i}@broncos.uncfsu.edu")
+            for i in range(1, count + 1)]
+
+
+def legacyFacultyCards(faculty):
+    # The pre-macro facultyPopulate() body, minus the database query.
+    factultyassembled = ""
+    for i in range(len(faculty)):
+        factultyassembled += Markup("""
+            <div class="row">
+                <div class="col-md-6 col-xxl-12" style="text-align: center;background: var(--bs-body-bg);width: 100%;margin: auto;padding-bottom: 76px;">
+                    <img class="rounded-circle teamprofilepictures" style="overflow: hidden;width: initial;" width="Width" height="Height" src="static/images/Faculty/Photo">
+                    <a href="Link" target="_blank"><h1 class="teamprofilenames">Name</h1></a>
+                    <h1 class="teamprofileprofessions" style="color: rgb(128, 128, 128);">Title</h1>
+                    <h1 class="teamprofileprofessions" style="color: rgb(128, 128, 128);">School</h1>
+                    <h1 class="teamprofileprofessions" style="color: rgb(128, 128, 128);font-size: 16px;">Email</h1>
+                    <p class="teamprofiledescription"><span style="color: rgb(0, 0, 0);">Bio</span></p>
+                </div>
+            </div>
+        """.replace("Name", faculty[i][1]).replace("Title", faculty[i][2]).replace("School", faculty[i][3]).replace("Email", faculty[i][4]).replace("Bio", faculty[i][5])).replace("Photo", faculty[i][6]).replace("Link", faculty[i][7]).replace("Width", "400px").replace("Height", "400px")
+    return factultyassembled
+
+
+def legacyStudentTableRows(students):
+    # The pre-macro populateStudentsTable() body, minus the database query.
+    students_assembled = ""
+    count = 0
+    for i in range(len(students)):
+        if count % 2 == 0:
+            students_assembled += Markup("""<tr style="background: #262a38;">""")
+        else:
+            students_assembled += Markup("""<tr style="background: #212430;">""")
+
+        students_assembled += Markup("""
+            <td style="color: var(--bs-table-color);" id="IDstudentname" value="Name">Name<br></td>
+            <td style="color: var(--bs-table-color);" id="IDstudenttier" value="Tier">Tier</td>
+            <td style="color: var(--bs-table-color);" id="IDstudentphoto" value="Image">Image</td>
+            <td style="color: var(--bs-table-color);" id="IDstudentschool" value="School">School</td>
+            <td style="color: var(--bs-table-color);" id="IDstudentemail" value="Email">Email</td>
+            <td class="text-center align-middle" style="max-height: 60px;height: 60px;width: 100px;">
+                <a class="btn btnMaterial btn-flat success semicircle" role="button" href="#" style="color: rgb(0,197,179);" onclick="editStudent(ID)"><i class="fas fa-pen"></i></a>
+                <a class="btn btnMaterial btn-flat accent btnNoBorders checkboxHover" role="button" style="margin-left: 5px;" onclick="promptDelete(ID, 'student')"  href="#">
+                    <i class="fas fa-trash btnNoBorders" style="color: #DC3545;"></i></a></td>
+        </tr>
+        """.replace("ID", str(students[i][0])).replace("Name", students[i][1]).replace("Tier", students[i][2])).replace("Image", students[i][3]).replace("School", students[i][4]).replace("Email", students[i][5])
+        count += 1
+    return students_assembled
+
+
+CASES = [
+    ("faculty cards", syntheticFaculty, legacyFacultyCards, lambda rows: renderProfiles('facultyCards', rows, "400px", "400px")),
+    ("student table rows", syntheticStudents, legacyStudentTableRows, lambda rows: renderProfiles('studentTableRows', rows)),
+]
+
+
+def best(function, rows, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(rows)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 50000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--budget', type=float, default=60.0, help="skip legacy runs estimated to take longer than this")
+    args = parser.parse_args()
+
+    print(f"{'case':<20}{'rows':>8}{'legacy (s)':>14}{'macro (s)':>14}{'speedup':>10}")
+    with app.test_request_context():
+        for name, generate, legacy, macro in CASES:
+            previous = None
+            for size in args.sizes:
+                rows = generate(size)
+                macroTime = best(macro, rows, args.repeat)
+
+                # Quadratic growth: estimate from the last measured size before committing to a run.
+                estimate = previous[1] * (size / previous[0]) ** 2 if previous else 0
+                if estimate > args.budget:
+                    print(f"{name:<20}{size:>8}{'~%.0f est.' % estimate:>14}{macroTime:>14.4f}{'':>10}")
+                    continue
+                legacyTime = best(legacy, rows, 1 if size > 1000 else args.repeat)
+                previous = (size, legacyTime)
+                print(f"{name:<20}{size:>8}{legacyTime:>14.4f}{macroTime:>14.4f}{legacyTime / macroTime:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+    Compares two load_test.py result files and flags the measurements that got worse.
+
+    Usage: python benchmarks/compare_results.py BASELINE.json CANDIDATE.json [--threshold 10]
+
+    A latency (p50/p99) counts as a regression when it grew by more than --threshold percent, and a
+    throughput when it dropped by more than that. Exits with status 1 when there is any regression.
+"""
+
+import argparse
+import json
+import sys
+
+# Measurements compared, and whether a larger value is better.
+METRICS = [("p50_ms", False), ("p99_ms", False), ("throughput", True)]
+
+
+def rows(report):
+    """
+    Yields (size, phase, route, measurements) for every route in a result file.
+    """
+    for size, result in report["sizes"].items():
+        for phase in ("test_client", "server"):
+            for route, measurements in result.get(phase, {}).items():
+                if isinstance(measurements, dict):
+                    yield size, phase, route, measurements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help="percent change treated as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = {(size, phase, route): values for size, phase, route, values in rows(json.load(file))}
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+
+    regressions = 0
+    print(f"{'size':>7} {'phase':<12}{'route':<24}{'metric':<12}{'baseline':>12}{'candidate':>12}{'change':>9}")
+    for size, phase, route, values in rows(candidate):
+        before = baseline.get((size, phase, route))
+        if before is None:
+            continue
+        for metric, higherIsBetter in METRICS:
+            if not before.get(metric) or values.get(metric) is None:
+                continue
+            change = (values[metric] - before[metric]) / before[metric] * 100
+            worse = -change if higherIsBetter else change
+            flag = " <-" if worse > args.threshold else ""
+            regressions += bool(flag)
+            print(f"{size:>7} {phase:<12}{route[:23]:<24}{metric:<12}{before[metric]:>12}{values[metric]:>12}{change:>+8.1f}%{flag}")
+
+    print("\n%d regression(s) above %.0f%%" % (regressions, args.threshold))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+    Reports response size and latency for each page route and the static assets it links to, sent
+    uncompressed and with each encoding the app can produce.
+
+    Usage: python benchmarks/compression_report.py [--db Impact.db] [--requests 50]
+
+    Run `flask --app flask_app build-assets` first to include the precompressed static siblings;
+    without it the assets are reported as sent today, uncompressed.
+
+    The database is copied to a temporary directory first, so the report never writes to the real one.
+"""
+
+import argparse
+import statistics
+import tempfile
+import shutil
+import time
+import sys
+import os
+import re
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import flask_app
+import compression
+
+ROUTES = ['/', '/coi', '/principalInvestigator', '/jplResearchers', '/students', '/adminLogin', '/admin']
+
+DESKTOP = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36'
+
+
+def measure(client, path, encoding, count):
+    headers = {'User-Agent': DESKTOP, 'Accept-Encoding': encoding or 'identity'}
+    times = []
+    size = 0
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        body = response.get_data()
+        times.append(time.perf_counter() - start)
+        size = len(body)
+        response.close()
+    return size, statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=os.path.join(ROOT, 'Impact.db'))
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    shutil.copy(args.db, os.path.join(workdir, 'Impact.db'))
+    flask_app.database.configure(os.path.join(workdir, 'Impact.db'))
+
+    client = flask_app.app.test_client()
+    with client.session_transaction() as session:
+        session['admin'] = True
+        session['adminID'] = 'report'
+
+    page = client.get('/students', headers={'User-Agent': DESKTOP}).get_data(as_text=True)
+    statics = sorted(set(re.findall(r'(?:href|src)="(/static/[^"?#]+\.(?:css|js))"', page)))
+
+    encodings = [None] + list(compression.ENCODINGS)
+    header = "%-60s" % "path" + "".join("%22s" % ("%s bytes / ms" % (encoding or 'identity')) for encoding in encodings)
+    print(header)
+    print("-" * len(header))
+    for path in ROUTES + statics:
+        cells = []
+        for encoding in encodings:
+            size, latency = measure(client, path, encoding, args.requests)
+            cells.append("%22s" % ("%d / %.2f" % (size, latency)))
+        print("%-60s" % path[:60] + "".join(cells))
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
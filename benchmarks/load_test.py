@@ -0,0 +1,322 @@
+"""
+    Load test: seeds synthetic databases of several sizes, drives every route through the Flask test client
+    and through a local multi-worker server, and writes throughput, p50/p99 latency and memory use as JSON.
+
+    Usage: python benchmarks/load_test.py [--sizes 10 1000 100000] [--requests 50] [--output results.json]
+                                          [--workers 2] [--threads 4] [--concurrency 8] [--no-server]
+
+    Each size seeds that many faculty, JPL researchers and students (see synthetic.py). The test client
+    phase runs in this process, one request at a time, and ends with photo uploads through /addProfile.
+    The server phase starts gunicorn (waitress where gunicorn is not available) and sends requests from
+    --concurrency threads. Compare two result files with compare_results.py.
+"""
+
+import concurrent.futures
+import http.client
+import subprocess
+import statistics
+import argparse
+import tempfile
+import datetime
+import platform
+import socket
+import shutil
+import json
+import time
+import sys
+import io
+import os
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import synthetic
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DESKTOP = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36'
+MOBILE = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1'
+
+# Seconds the upload phase waits for the photo workers before giving up.
+UPLOAD_TIMEOUT = 300
+
+# Routes measured in both phases, as (name, path, user agent, needs an admin session).
+ROUTES = [
+    ("index", "/", DESKTOP, False),
+    ("coi", "/coi", DESKTOP, False),
+    ("coi mobile", "/coi", MOBILE, False),
+    ("principalInvestigator", "/principalInvestigator", DESKTOP, False),
+    ("jplResearchers", "/jplResearchers", DESKTOP, False),
+    ("students", "/students", DESKTOP, False),
+    ("students mobile", "/students", MOBILE, False),
+    ("search", "/search?q=robotics", DESKTOP, False),
+    ("search prefix", "/search?q=stud", DESKTOP, False),
+    ("adminLogin", "/adminLogin", DESKTOP, False),
+    ("admin", "/admin", DESKTOP, True),
+    ("api students", "/api/students?limit=50&html=1", DESKTOP, True),
+    ("api faculty by name", "/api/faculty?sort=name&order=desc", DESKTOP, True),
+    ("api jpl search", "/api/jpl?q=rover", DESKTOP, True),
+]
+
+
+def summarize(latencies, elapsed):
+    """
+    Returns request count, throughput and latency percentiles (in milliseconds) for a list of latencies in seconds.
+    """
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "throughput": round(len(ordered) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def rssMegabytes(pid="self"):
+    """
+    Returns the resident memory of a process in MB, or None where /proc is not available.
+    """
+    try:
+        with open("/proc/%s/statm" % pid) as file:
+            return round(int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def childPids(pid):
+    try:
+        with open("/proc/%d/task/%d/children" % (pid, pid)) as file:
+            return [int(child) for child in file.read().split()]
+    except OSError:
+        return []
+
+
+def clientPhase(flask_app, dbPath, uploads, count):
+    """
+    Measures every route through the test client, then photo uploads. The first request to each route
+    (a page cache miss) is reported separately from the rest.
+    """
+    flask_app.configureApp({"DB_PATH": dbPath, "UPLOAD": uploads})
+    flask_app.clearPageCache()
+    client = flask_app.app.test_client()
+    with client.session_transaction() as session:
+        session['admin'] = True
+        session['adminID'] = 'benchmark'
+    anonymous = flask_app.app.test_client()
+
+    results = {}
+    for name, path, userAgent, admin in ROUTES:
+        agent = client if admin else anonymous
+        headers = {'User-Agent': userAgent, 'Accept-Encoding': 'br, gzip'}
+        start = time.perf_counter()
+        response = agent.get(path, headers=headers)
+        first = time.perf_counter() - start
+        assert response.status_code == 200, (path, response.status_code)
+
+        latencies = []
+        began = time.perf_counter()
+        for _ in range(count):
+            start = time.perf_counter()
+            agent.get(path, headers=headers).close()
+            latencies.append(time.perf_counter() - start)
+        results[name] = dict(summarize(latencies, time.perf_counter() - began), first_ms=round(first * 1000, 3), bytes=len(response.data))
+
+    results["upload"] = uploadPhase(flask_app, client, max(1, count // 5))
+    return results
+
+
+def uploadPhase(flask_app, client, count):
+    """
+    Posts synthetic student photos to /addProfile, then waits for the worker pool to process them.
+    Reports the request latency and the processing time of the jobs.
+    """
+    photos = [synthetic.photoBytes(("upload", index), (2400, 1800)) for index in range(count)]
+    # Photos are stored under the hash of their bytes, so these are the names their jobs carry.
+    names = {flask_app.images.photoName(photo, 'upload.jpg') for photo in photos}
+    jobs = []
+
+    def collect(job):
+        if job["file"] in names:
+            jobs.append(dict(job))
+
+    flask_app.images.on_finish.append(collect)
+    try:
+        latencies = []
+        began = time.perf_counter()
+        for index, photo in enumerate(photos):
+            start = time.perf_counter()
+            response = client.post('/addProfile', content_type='multipart/form-data', data={
+                'profileType': 'student', 'name': 'Upload %d' % index, 'tier': 'Senior', 'school': 'FSU',
+                'email': 'upload%d@example.edu' % index, 'photo': (io.BytesIO(photo), 'upload%d.jpg' % index)})
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 302, response.status_code
+
+        deadline = time.monotonic() + UPLOAD_TIMEOUT
+        while len(jobs) < len(names):
+            if time.monotonic() > deadline:
+                raise TimeoutError("%d of %d uploaded photos were not processed within %d s" % (len(names) - len(jobs), len(names), UPLOAD_TIMEOUT))
+            time.sleep(0.05)
+    finally:
+        flask_app.images.on_finish.remove(collect)
+    processing = [job["seconds"] for job in jobs if job["status"] == "done"]
+    result = summarize(latencies, time.perf_counter() - began)
+    result["photo_bytes"] = round(statistics.mean(len(photo) for photo in photos))
+    result["processing_p50_ms"] = round(statistics.median(processing) * 1000, 3) if processing else None
+    result["failed"] = sum(job["status"] == "failed" for job in jobs)
+    return result
+
+
+def freePort():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serverPhase(dbPath, uploads, count, workers, threads, concurrency):
+    """
+    Starts a local server on the seeded data and sends count requests per route from concurrency threads.
+    """
+    port = freePort()
+    environment = dict(os.environ, IMPACT_DB_PATH=dbPath, IMPACT_UPLOAD_FOLDER=uploads, IMPACT_BIND="127.0.0.1:%d" % port,
+                       IMPACT_WORKERS=str(workers), IMPACT_THREADS=str(threads), IMPACT_ACCESS_LOG="/dev/null")
+    if shutil.which("gunicorn") or importable("gunicorn"):
+        command, server = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"], "gunicorn"
+    else:
+        command, server = [sys.executable, "wsgi.py"], "waitress"
+    process = subprocess.Popen(command, cwd=ROOT, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 30
+        while not reachable(port):
+            if time.time() > deadline or process.poll() is not None:
+                raise RuntimeError("%s did not start" % server)
+            time.sleep(0.1)
+
+        results = {"server": server, "workers": workers if server == "gunicorn" else 1, "threads": threads, "concurrency": concurrency}
+        for name, path, userAgent, admin in ROUTES:
+            if admin:
+                continue
+            headers = {'User-Agent': userAgent, 'Accept-Encoding': 'br, gzip'}
+            request(port, path, headers)
+
+            def timed(_):
+                start = time.perf_counter()
+                request(port, path, headers)
+                return time.perf_counter() - start
+
+            began = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+                latencies = list(pool.map(timed, range(count)))
+            results[name] = summarize(latencies, time.perf_counter() - began)
+
+        pids = [process.pid] + childPids(process.pid)
+        memory = [rssMegabytes(pid) for pid in pids]
+        results["rss_mb"] = round(sum(memory), 1) if None not in memory else None
+        return results
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def importable(module):
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def reachable(port):
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return True
+    except OSError:
+        return False
+
+
+class FinalResponse(http.client.HTTPResponse):
+    """
+    A response that skips every interim (1xx) response, such as 103 Early Hints. http.client only skips 100 Continue.
+    """
+    def _read_status(self):
+        status = super()._read_status()
+        while 100 < status[1] < 200:
+            while self.fp.readline(65537) not in (b"\r\n", b"\n", b""):
+                pass
+            status = super()._read_status()
+        return status
+
+
+def request(port, path, headers):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    connection.response_class = FinalResponse
+    try:
+        connection.request("GET", path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError("%s answered %d" % (path, response.status))
+    finally:
+        connection.close()
+
+
+def gitCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100000], help="rows per table")
+    parser.add_argument('--requests', type=int, default=50, help="requests per route")
+    parser.add_argument('--photos', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--no-server', action='store_true', help="only run the test client phase")
+    parser.add_argument('--output', default='load_test_results.json')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['IMPACT_DB_PATH'] = os.path.join(workdir, 'unused.db')
+    import flask_app
+
+    report = {
+        "commit": gitCommit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": {},
+    }
+    try:
+        for size in args.sizes:
+            print("seeding %d rows per table" % size, file=sys.stderr)
+            started = time.perf_counter()
+            dbPath, uploads = synthetic.seed(os.path.join(workdir, str(size)), size, size, size, args.photos)
+            result = {"seed_seconds": round(time.perf_counter() - started, 2)}
+
+            print("test client", file=sys.stderr)
+            result["test_client"] = clientPhase(flask_app, dbPath, uploads, args.requests)
+            result["test_client"]["rss_mb"] = rssMegabytes()
+            result["test_client"]["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1) if resource else None
+            flask_app.database.close()
+
+            if not args.no_server:
+                print("server", file=sys.stderr)
+                result["server"] = serverPhase(dbPath, uploads, args.requests, args.workers, args.threads, args.concurrency)
+            report["sizes"][str(size)] = result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=1)
+    print("results written to %s" % args.output, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
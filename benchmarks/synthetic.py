@@ -0,0 +1,107 @@
+"""
+    Synthetic data for benchmarks: seeds a copy of Impact.db with generated faculty, JPL researchers and
+    students, and generates photos for them and for upload tests.
+
+    Usage: python benchmarks/synthetic.py OUTPUT_DIR [--faculty 1000] [--jpl 1000] [--students 10000] [--photos 20]
+
+    OUTPUT_DIR receives Impact.db and an images/ folder laid out like static/images (Faculty/, JPL/, Students/,
+    each with its variants/). Point the app at them with IMPACT_DB_PATH and IMPACT_UPLOAD_FOLDER.
+"""
+
+import argparse
+import random
+import shutil
+import sys
+import io
+import os
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from PIL import Image, ImageDraw
+
+import database
+import images
+
+WORDS = ("robotics vision learning neural satellite orbit data graph model deep systems cloud mars rover autonomy "
+         "sensor planning imaging spectrometer mission control network security quantum optimization").split()
+SCHOOLS = ("FSU", "NCCU", "WSSU", "Alumni")
+TIERS = ("Freshman", "Sophomore", "Junior", "Senior", "Graduate")
+
+
+def photoBytes(seed, size=(1200, 900)):
+    """
+    Returns a JPEG of the given size that looks enough like a photo (shapes over a gradient) to compress like one.
+    """
+    generator = random.Random(str(seed))
+    photo = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(photo)
+    for _ in range(40):
+        x, y = generator.randrange(size[0]), generator.randrange(size[1])
+        radius = generator.randrange(20, 200)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=tuple(generator.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def bio(generator, words=60):
+    return " ".join(generator.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def seed(output, faculty=100, jpl=100, students=1000, photos=20, source=os.path.join(ROOT, 'Impact.db')):
+    """
+    Writes output/Impact.db (a copy of source plus the generated rows) and output/images/ with photos processed
+    the way uploads are. Returns the paths of the database and of the images folder (with a trailing separator).
+    """
+    os.makedirs(output, exist_ok=True)
+    dbPath = os.path.join(output, 'Impact.db')
+    shutil.copy(source, dbPath)
+    uploads = os.path.join(output, 'images') + os.sep
+
+    names = {}
+    for folder in ("Faculty", "JPL", "Students"):
+        os.makedirs(os.path.join(uploads, folder), exist_ok=True)
+        names[folder] = []
+        for index in range(photos):
+            name = "synthetic%d.jpg" % index
+            images.processPhoto(photoBytes((folder, index)), os.path.join(uploads, folder, name))
+            names[folder].append(name)
+
+    generator = random.Random(0)
+    database.configure(dbPath)
+    conn = database.getConnection()
+    with conn:
+        conn.executemany("INSERT INTO faculty (name, title, school, email, bio, image, link, role) VALUES (?,?,?,?,?,?,?,?)", [
+            ("Dr. Faculty %d %s" % (i, generator.choice(WORDS).capitalize()), "Professor of Computer Science",
+             generator.choice(SCHOOLS), "faculty%d&#64;example.edu" % i, bio(generator), names["Faculty"][i % photos] if photos else None,
+             "https://example.edu/faculty%d" % i, "pi" if i % 10 == 0 else "copi")
+            for i in range(faculty)])
+        conn.executemany("INSERT INTO jpl (name, title, location, email, bio, image) VALUES (?,?,?,?,?,?)", [
+            ("Researcher %d %s" % (i, generator.choice(WORDS).capitalize()), "Data Scientist", "Pasadena, CA",
+             "researcher%d&#64;jpl.example.gov" % i, bio(generator), names["JPL"][i % photos] if photos else None)
+            for i in range(jpl)])
+        conn.executemany("INSERT INTO students (name, student_tier, image, school, email) VALUES (?,?,?,?,?)", [
+            ("Student %d %s" % (i, generator.choice(WORDS).capitalize()), generator.choice(TIERS),
+             names["Students"][i % photos] if photos else None, generator.choice(SCHOOLS), "student%d@example.edu" % i)
+            for i in range(students)])
+    database.close()
+    return dbPath, uploads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output')
+    parser.add_argument('--faculty', type=int, default=1000)
+    parser.add_argument('--jpl', type=int, default=1000)
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--photos', type=int, default=20, help="distinct photos per folder, shared round-robin by the rows")
+    args = parser.parse_args()
+
+    dbPath, uploads = seed(args.output, args.faculty, args.jpl, args.students, args.photos)
+    print("IMPACT_DB_PATH=%s" % dbPath)
+    print("IMPACT_UPLOAD_FOLDER=%s" % uploads)
+
+
+if __name__ == '__main__':
+    main()
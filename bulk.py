@@ -0,0 +1,242 @@
+from werkzeug.utils import secure_filename
+from PIL import Image
+import zipfile
+import json
+import csv
+import io
+import os
+
+import images
+
+"""
+    Bulk import and export of profiles.
+
+    An import is a CSV or JSON file of profiles plus, optionally, a ZIP archive of their photos. Everything
+    is checked before anything is written: the columns and required values of every row, and that every
+    photo a row names is in the archive (or already uploaded) and decodes as an image. Only then are the
+    rows inserted, all tables in one transaction, and the photos handed to the photo worker pool.
+
+    Exports stream the tables row by row as CSV or JSON, so their memory use does not grow with the tables.
+"""
+
+# Columns of each table that can be imported, in export order; the ones that must have a value; defaults for
+# the ones that may be left out; and the folder its photos are stored in.
+TABLES = {
+    "faculty": {
+        "key": "FID",
+        "columns": ("name", "title", "school", "email", "bio", "image", "link", "role"),
+        "required": ("name", "title", "school", "email", "bio", "image"),
+        "defaults": {"role": "copi"},
+        "folder": "Faculty",
+    },
+    "jpl": {
+        "key": "RID",
+        "columns": ("name", "title", "location", "email", "bio", "image"),
+        "required": ("name", "title", "location", "email", "bio", "image"),
+        "defaults": {},
+        "folder": "JPL",
+    },
+    "students": {
+        "key": "SID",
+        "columns": ("name", "student_tier", "image", "school", "email"),
+        "required": ("name", "student_tier", "image"),
+        "defaults": {},
+        "folder": "Students",
+    },
+}
+
+ROLES = ("pi", "copi")
+PHOTO_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# Largest photo, and largest total of photos, read from an archive (uncompressed bytes).
+MAX_PHOTO_SIZE = 25 * 1024 * 1024
+MAX_ARCHIVE_SIZE = 1024 * 1024 * 1024
+
+# Rows per chunk when streaming an export.
+EXPORT_CHUNK = 500
+
+
+class ImportFailed(ValueError):
+    """
+    Raised when an import does not validate. errors lists every problem found, as readable messages.
+    """
+    def __init__(self, errors):
+        super().__init__("%d problem(s) found, nothing was imported" % len(errors))
+        self.errors = errors
+
+
+def parseRecords(data, format, table=None):
+    """
+    Reads the profiles in a CSV or JSON file. A CSV file, or a JSON list, holds rows of the given table;
+    a JSON object maps table names to lists of rows. Returns {table: [row dicts]}.
+    """
+    if format == "csv":
+        if table not in TABLES:
+            raise ImportFailed(["Choose the table the CSV file is for: faculty, jpl or students."])
+        text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+        return {table: list(csv.DictReader(io.StringIO(text)))}
+
+    try:
+        parsed = json.loads(data)
+    except ValueError as error:
+        raise ImportFailed(["The JSON file could not be read: %s" % error])
+    if isinstance(parsed, list):
+        if table not in TABLES:
+            raise ImportFailed(["Choose the table the JSON list is for: faculty, jpl or students."])
+        parsed = {table: parsed}
+    if not isinstance(parsed, dict) or not all(isinstance(rows, list) for rows in parsed.values()):
+        raise ImportFailed(["The JSON file must hold a list of rows or an object of lists keyed by table."])
+    return parsed
+
+
+def openArchive(data):
+    """
+    Returns {safe file name: ZipInfo} for the photos in a ZIP archive, ignoring folders inside it.
+    """
+    if not data:
+        return None, {}
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise ImportFailed(["The photo archive is not a ZIP file."])
+    entries = {}
+    for info in archive.infolist():
+        name = secure_filename(os.path.basename(info.filename))
+        if not info.is_dir() and name.lower().endswith(PHOTO_EXTENSIONS):
+            entries[name] = info
+    if sum(info.file_size for info in entries.values()) > MAX_ARCHIVE_SIZE:
+        raise ImportFailed(["The photo archive unpacks to more than %d MB." % (MAX_ARCHIVE_SIZE // 2 ** 20)])
+    return archive, entries
+
+
+def prepare(records, archiveData=None, photoExists=lambda folder, name: False):
+    """
+    Validates the parsed records against TABLES and the photo archive. photoExists(folder, name) tells whether
+    a photo that is not in the archive has been uploaded before. Returns ({table: [value tuples in TABLES
+    column order]}, [(folder, stored name, photo bytes)]), where photos from the archive are renamed to the
+    content-addressed name images.photoName() gives them. Raises ImportFailed listing every problem.
+    """
+    archive, entries = openArchive(archiveData)
+    errors = []
+    rows = {}
+    photos = {}
+    read = {}
+
+    for table, records_ in records.items():
+        spec = TABLES.get(table)
+        if spec is None:
+            errors.append("Unknown table %r." % table)
+            continue
+        rows[table] = []
+        allowed = set(spec["columns"]) | {spec["key"]}
+        for number, record in enumerate(records_, 1):
+            where = "%s row %d" % (table, number)
+            if not isinstance(record, dict):
+                errors.append("%s: not an object." % where)
+                continue
+            # csv.DictReader puts the fields past the header's under None.
+            if None in record:
+                errors.append("%s has more fields than the header." % where)
+            unknown = sorted(set(record) - allowed - {None})
+            if unknown:
+                errors.append("%s: unknown column(s) %s." % (where, ", ".join(map(str, unknown))))
+            values = {}
+            for column in spec["columns"]:
+                value = record.get(column)
+                value = value.strip() if isinstance(value, str) else value
+                values[column] = spec["defaults"].get(column) if value in (None, "") else str(value)
+            for column in spec["required"]:
+                if not values[column]:
+                    errors.append("%s: %s is required." % (where, column))
+            if "role" in values and values["role"] not in ROLES:
+                errors.append("%s: role must be one of %s." % (where, ", ".join(ROLES)))
+
+            if values["image"]:
+                name = secure_filename(os.path.basename(values["image"]))
+                values["image"] = name
+                if not name.lower().endswith(PHOTO_EXTENSIONS):
+                    errors.append("%s: image %r is not a PNG or JPEG file." % (where, name))
+                elif name in entries:
+                    if name not in read:
+                        read[name] = readPhoto(archive, entries[name])
+                    problem, data = read[name]
+                    if problem:
+                        errors.append("%s: image %r %s." % (where, name, problem))
+                    else:
+                        values["image"] = images.photoName(data, name)
+                        photos[(spec["folder"], values["image"])] = data
+                elif not photoExists(spec["folder"], name):
+                    errors.append("%s: image %r is neither in the archive nor uploaded before." % (where, name))
+            rows[table].append(tuple(values[column] for column in spec["columns"]))
+
+    if errors:
+        raise ImportFailed(errors)
+    return rows, [(folder, name, data) for (folder, name), data in photos.items()]
+
+
+def readPhoto(archive, info):
+    """
+    Reads a photo out of the archive and checks that it decodes. Returns (problem or None, bytes).
+    """
+    if info.file_size > MAX_PHOTO_SIZE:
+        return "is larger than %d MB" % (MAX_PHOTO_SIZE // 2 ** 20), None
+    data = archive.read(info)
+    try:
+        images.checkPhoto(data)
+        with Image.open(io.BytesIO(data)) as photo:
+            photo.verify()
+    except images.PhotoRejected as error:
+        return "is refused (%s)" % str(error).rstrip("."), None
+    except Exception:
+        return "is not a readable image", None
+    return None, data
+
+
+def insertStatement(table):
+    """
+    Returns the INSERT statement that takes the value tuples prepare() returns for the table.
+    """
+    columns = TABLES[table]["columns"]
+    return "INSERT INTO %s (%s) VALUES (%s)" % (table, ", ".join(columns), ", ".join("?" * len(columns)))
+
+
+def exportColumns(table):
+    """
+    Returns the columns an export of the table contains: its key, then the importable columns.
+    """
+    return (TABLES[table]["key"],) + TABLES[table]["columns"]
+
+
+def streamCsv(table, rows):
+    """
+    Yields the table's rows as CSV text in chunks of EXPORT_CHUNK rows, header first.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(exportColumns(table))
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % EXPORT_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def streamJson(tables):
+    """
+    Yields {table: [row objects]} as JSON text for each (table, rows) pair in tables, in chunks of EXPORT_CHUNK rows.
+    The output can be imported again as it is.
+    """
+    yield "{"
+    for index, (table, rows) in enumerate(tables):
+        columns = exportColumns(table)
+        yield "%s%s: [" % (", " if index else "", json.dumps(table))
+        chunk = []
+        for count, row in enumerate(rows):
+            chunk.append(("\n  " if count == 0 else ",\n  ") + json.dumps(dict(zip(columns, row))))
+            if len(chunk) == EXPORT_CHUNK:
+                yield "".join(chunk)
+                chunk = []
+        yield "".join(chunk) + "\n]"
+    yield "}\n"
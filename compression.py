@@ -0,0 +1,161 @@
+import collections
+import threading
+import hashlib
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+"""
+    Response compression.
+
+    Dynamic responses are compressed per request with whichever of brotli or gzip the client accepts.
+    Cached roster pages produce the same body over and over, so the last few compressed bodies are kept
+    and reused. Static text assets are compressed once, when `flask build-assets` runs, and their .br
+    and .gz siblings are served as-is.
+
+    brotli is listed in requirements.txt but not imported unconditionally; without the package only gzip is used.
+"""
+
+# Encodings this process can produce, in order of preference, with the file suffix of their precompressed siblings.
+ENCODINGS = collections.OrderedDict([("br", ".br"), ("gzip", ".gz")] if brotli else [("gzip", ".gz")])
+
+# Responses smaller than this are sent as they are; compressing them saves less than the headers cost.
+MINIMUM_SIZE = 512
+
+# Content types worth compressing. Images and fonts other than SVG/TTF/OTF/EOT are compressed already.
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/css", "text/plain", "text/csv", "text/javascript", "application/javascript",
+    "application/json", "application/xml", "image/svg+xml", "font/ttf", "font/otf",
+    "application/vnd.ms-fontobject", "application/x-font-ttf", "font/sfnt",
+}
+
+# Static file extensions precompressed by the build step.
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".html", ".json", ".txt", ".ttf", ".otf", ".eot")
+
+# Number of compressed dynamic bodies kept for reuse.
+cache_size = 64
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+# Lookups in the compressed body cache that found (hits) or had to compress (misses) the body.
+cache_stats = {"hits": 0, "misses": 0}
+
+
+def negotiate(acceptEncoding, available=None):
+    """
+    Picks the preferred encoding that the Accept-Encoding header allows and that is available.
+    Returns None when the response should be sent uncompressed.
+    """
+    accepted = {}
+    for part in (acceptEncoding or "").lower().split(","):
+        name, _, parameters = part.strip().partition(";")
+        quality = 1.0
+        if parameters.strip().startswith("q="):
+            try:
+                quality = float(parameters.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name] = quality
+
+    for encoding in ENCODINGS:
+        if available is not None and encoding not in available:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding, level=None):
+    """
+    Compresses data with the given encoding.
+    """
+    if encoding == "br":
+        return brotli.compress(data, quality=5 if level is None else level)
+    return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+
+
+def compressCached(data, encoding):
+    """
+    Compresses a dynamic response body, reusing the result when an identical body was compressed recently.
+    """
+    key = (encoding, hashlib.sha1(data).digest())
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            cache_stats["hits"] += 1
+            return _cache[key]
+        cache_stats["misses"] += 1
+
+    compressed = compress(data, encoding)
+    with _cache_lock:
+        _cache[key] = compressed
+        while len(_cache) > cache_size:
+            _cache.popitem(last=False)
+    return compressed
+
+
+def shouldCompress(response):
+    """
+    Tells whether a dynamic response is worth compressing.
+    """
+    return (response.status_code == 200
+            and not response.direct_passthrough
+            and not response.is_streamed
+            and "Content-Encoding" not in response.headers
+            and response.mimetype in COMPRESSIBLE_TYPES
+            and (response.content_length or 0) >= MINIMUM_SIZE)
+
+
+def shouldCompressStream(response):
+    """
+    Tells whether a streamed response (a page sent while it renders, an export) should be compressed as it goes.
+    """
+    return (response.status_code == 200
+            and response.is_streamed
+            and not response.direct_passthrough
+            and "Content-Encoding" not in response.headers
+            and response.mimetype in COMPRESSIBLE_TYPES)
+
+
+def compressStream(chunks, encoding):
+    """
+    Compresses a streamed body chunk by chunk, flushing after each one so the client can use what has arrived.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        process, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    try:
+        for chunk in chunks:
+            data = process(chunk.encode() if isinstance(chunk, str) else chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def precompress(path):
+    """
+    Writes the maximum-effort .br and .gz siblings of a static file. Returns the suffixes written.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+
+    written = []
+    for encoding, suffix in ENCODINGS.items():
+        compressed = compress(data, encoding, 11 if encoding == "br" else 9)
+        if len(compressed) < len(data):
+            with open(path + suffix, "wb") as file:
+                file.write(compressed)
+            written.append(suffix)
+    return written
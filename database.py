@@ -0,0 +1,321 @@
+import threading
+import sqlite3
+import time
+import os
+
+"""
+    Data access layer for Impact.db.
+
+    Each thread keeps one open connection to the database instead of connecting for every query. The
+    connection runs in WAL mode with a busy timeout so several gunicorn workers can keep reading while
+    an admin writes. Python's sqlite3 module keeps a per-connection cache of compiled statements, so
+    reusing the connection also reuses the prepared statements behind the queries in flask_app.py.
+
+    Triggers keep a version number and last-modified time per roster table in data_version. Reading
+    them through tableVersions() is nearly free: they are only re-read after PRAGMA data_version says
+    another connection (any thread or worker) has committed, or after this thread wrote itself.
+
+    Other triggers mirror every profile into people_search, an FTS5 index behind search(), so it stays
+    in step with the roster tables whichever code path (or sqlite3 shell) writes to them.
+"""
+
+# Path to the database file. Set through configure() before the first query.
+db_path = None
+
+# Journal mode and busy timeout (seconds) applied to every new connection.
+journal_mode = "wal"
+busy_timeout = 5.0
+
+# Number of compiled statements each connection keeps around for reuse.
+cached_statements = 256
+
+# Tables whose changes are tracked in data_version.
+VERSIONED_TABLES = ("faculty", "jpl", "students")
+
+# Tables mirrored into the people_search full-text index: the code stored in the low bits of the rowid, the key
+# column, and the expressions indexed as title, school and bio, and stored as role.
+SEARCH_KINDS = {
+    "faculty": (1, "FID", "title", "school", "bio", "role"),
+    "jpl": (2, "RID", "title", "location", "bio", "''"),
+    "students": (3, "SID", "student_tier", "school", "''", "''"),
+}
+
+
+def searchStatements(table):
+    """
+    Returns the statements that fill in the table's missing people_search entries and the triggers that keep them in sync.
+    """
+    code, key, title, school, bio, role = SEARCH_KINDS[table]
+    values = {"table": table, "code": code, "key": key, "title": title, "school": school, "bio": bio, "role": role}
+    # Inside a trigger the columns belong to the NEW row; literals such as '' stay as they are.
+    values.update({"new_" + name: expression if expression.startswith("'") else "NEW." + expression
+                   for name, expression in (("title", title), ("school", school), ("bio", bio), ("role", role))})
+    insert = ("INSERT INTO people_search (rowid, kind, role, name, title, school, bio) "
+              "VALUES (NEW.%(key)s * 4 + %(code)d, '%(table)s', %(new_role)s, NEW.name, %(new_title)s, %(new_school)s, %(new_bio)s); ")
+    return [statement % values for statement in (
+        # Profiles that existed before the index (or were written while its triggers were missing) are added here.
+        "INSERT INTO people_search (rowid, kind, role, name, title, school, bio) "
+        "SELECT %(key)s * 4 + %(code)d, '%(table)s', %(role)s, name, %(title)s, %(school)s, %(bio)s FROM %(table)s "
+        "WHERE NOT EXISTS (SELECT 1 FROM people_search WHERE rowid = %(key)s * 4 + %(code)d)",
+        "CREATE TRIGGER IF NOT EXISTS %(table)s_search_insert AFTER INSERT ON %(table)s BEGIN " + insert + "END",
+        "CREATE TRIGGER IF NOT EXISTS %(table)s_search_update AFTER UPDATE ON %(table)s BEGIN "
+        "DELETE FROM people_search WHERE rowid = OLD.%(key)s * 4 + %(code)d; " + insert + "END",
+        "CREATE TRIGGER IF NOT EXISTS %(table)s_search_delete AFTER DELETE ON %(table)s BEGIN "
+        "DELETE FROM people_search WHERE rowid = OLD.%(key)s * 4 + %(code)d; END",
+    )]
+
+
+# Statements run once per process against each database before it is used. They must be idempotent.
+SCHEMA = [
+    # Lets the admin API filter the students by school instead of scanning the table.
+    "CREATE INDEX IF NOT EXISTS students_school ON students(school)",
+
+    # Sorting by each sortable column in the paginated admin API (see keysetPage). The primary key is the rowid,
+    # so these also order ties by id. students(school) above serves sorting by school.
+    "CREATE INDEX IF NOT EXISTS faculty_name ON faculty(name)",
+    "CREATE INDEX IF NOT EXISTS faculty_title ON faculty(title)",
+    "CREATE INDEX IF NOT EXISTS faculty_school ON faculty(school)",
+    "CREATE INDEX IF NOT EXISTS faculty_email ON faculty(email)",
+    "CREATE INDEX IF NOT EXISTS faculty_role ON faculty(role)",
+    "CREATE INDEX IF NOT EXISTS jpl_name ON jpl(name)",
+    "CREATE INDEX IF NOT EXISTS jpl_title ON jpl(title)",
+    "CREATE INDEX IF NOT EXISTS jpl_location ON jpl(location)",
+    "CREATE INDEX IF NOT EXISTS jpl_email ON jpl(email)",
+    "CREATE INDEX IF NOT EXISTS students_name ON students(name)",
+    "CREATE INDEX IF NOT EXISTS students_tier ON students(student_tier)",
+    "CREATE INDEX IF NOT EXISTS students_email ON students(email)",
+
+    # One row per roster table: a counter bumped by every write and the time (Unix seconds) of the last one.
+    "CREATE TABLE IF NOT EXISTS data_version (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0, updated INTEGER NOT NULL DEFAULT 0)",
+] + [
+    "INSERT OR IGNORE INTO data_version (name, updated) VALUES ('%s', CAST(strftime('%%s', 'now') AS INTEGER))" % table
+    for table in VERSIONED_TABLES
+] + [
+    "CREATE TRIGGER IF NOT EXISTS %s_version_%s AFTER %s ON %s BEGIN "
+    "UPDATE data_version SET version = version + 1, updated = CAST(strftime('%%s', 'now') AS INTEGER) WHERE name = '%s'; END"
+    % (table, operation.lower(), operation, table, table)
+    for table in VERSIONED_TABLES for operation in ("INSERT", "UPDATE", "DELETE")
+] + [
+    # Full-text index over every profile. The rowid packs the table and the profile id (id * 4 + SEARCH_KINDS
+    # code), so the triggers from searchStatements() find a profile's entry by rowid instead of scanning the index.
+    "CREATE VIRTUAL TABLE IF NOT EXISTS people_search USING fts5("
+    "kind UNINDEXED, role UNINDEXED, name, title, school, bio, tokenize = 'unicode61 remove_diacritics 2')",
+] + [statement for table in SEARCH_KINDS for statement in searchStatements(table)]
+
+# Callables run with (sql, seconds) after every statement, e.g. to record timings.
+on_statement = []
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def configure(path, journalMode="wal", busyTimeout=5.0):
+    """
+    Points the data layer at a database file. Connections opened for a previous path are replaced on next use.
+    """
+    global db_path, journal_mode, busy_timeout
+    db_path = path
+    journal_mode = journalMode
+    busy_timeout = busyTimeout
+
+
+def connect():
+    """
+    Opens a new connection to the configured database with the pragmas the app relies on.
+    """
+    conn = sqlite3.connect(db_path, timeout=busy_timeout, cached_statements=cached_statements)
+    conn.execute("PRAGMA busy_timeout = %d" % int(busy_timeout * 1000))
+    if journal_mode:
+        conn.execute("PRAGMA journal_mode = %s" % journal_mode)
+    # With WAL, NORMAL only gives up durability of the very last commits on power loss, never consistency.
+    if journal_mode and journal_mode.lower() == "wal":
+        conn.execute("PRAGMA synchronous = NORMAL")
+    ensureSchema(conn)
+    return conn
+
+
+def ensureSchema(conn):
+    """
+    Applies SCHEMA to the connection's database the first time this process opens it. Workers forked
+    after the schema was applied (gunicorn --preload) inherit that and skip it.
+    """
+    if db_path in _schema_ready:
+        return
+    with _schema_lock:
+        if db_path not in _schema_ready:
+            with conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+            _schema_ready.add(db_path)
+
+
+def getConnection():
+    """
+    Returns this thread's connection, opening one on first use, after a fork or after configure() changed the path.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid() or _local.path != db_path:
+        conn = connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = db_path
+        _local.versions = None
+    return conn
+
+
+def close():
+    """
+    Closes this thread's connection, if it has one.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+
+def timed(sql, started):
+    """
+    Reports how long a statement took to the on_statement callbacks.
+    """
+    elapsed = time.perf_counter() - started
+    for callback in on_statement:
+        callback(sql, elapsed)
+
+
+def query(sql, params=()):
+    """
+    Runs a SELECT and returns every row.
+    """
+    started = time.perf_counter()
+    rows = getConnection().execute(sql, params).fetchall()
+    timed(sql, started)
+    return rows
+
+
+def queryOne(sql, params=()):
+    """
+    Runs a SELECT and returns the first row, or None.
+    """
+    started = time.perf_counter()
+    row = getConnection().execute(sql, params).fetchone()
+    timed(sql, started)
+    return row
+
+
+def keysetPage(table, key, sort, descending=False, after=None, limit=25, where=(), params=()):
+    """
+    Returns one page of table ordered by the sort expression, ties broken by the key column, and the
+    cursor for the next page (None on the last page). after is the cursor returned with the previous
+    page. where holds extra SQL conditions, ANDed together, with their values in params.
+
+    Pages are found by seeking past the cursor rather than with OFFSET, so every page costs the same
+    no matter how deep it is. sort should be a column with a (sort, key) index. NULLs sort first; a cursor
+    at a NULL (or, descending, at the last value) seeks into the NULLs (or the values) as a second range, since
+    a row value comparison with NULL matches nothing. table, key, sort and where are put into the SQL as-is
+    and must never come from the request.
+    """
+    direction, comparison = ("DESC", "<") if descending else ("ASC", ">")
+    if after is None:
+        ranges = [((), [])]
+    elif after[0] is None:
+        ranges = [(("%s IS NULL" % sort, "%s %s ?" % (key, comparison)), [after[1]])]
+        ranges += [] if descending else [(("%s IS NOT NULL" % sort,), [])]
+    else:
+        ranges = [(("(%s, %s) %s (?, ?)" % (sort, key, comparison),), list(after))]
+        ranges += [(("%s IS NULL" % sort,), [])] if descending else []
+
+    rows = []
+    for seek, values in ranges:
+        conditions = list(where) + list(seek)
+        sql = "SELECT *, %s, %s FROM %s" % (sort, key, table)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY %s %s, %s %s LIMIT ?" % (sort, direction, key, direction)
+        rows += query(sql, list(params) + values + [limit + 1 - len(rows)])
+        if len(rows) > limit:
+            break
+
+    cursor = list(rows[limit - 1][-2:]) if len(rows) > limit else None
+    return [row[:-2] for row in rows[:limit]], cursor
+
+
+def matchExpression(text):
+    """
+    Turns what a visitor typed into an FTS5 query that matches profiles containing every word, the last one
+    as a prefix so results show up while typing. Returns None when there is nothing to search for.
+    """
+    words = [word.replace('"', '""') for word in text.split()]
+    if not words:
+        return None
+    return " ".join('"%s"' % word for word in words[:-1]) + (" " if len(words) > 1 else "") + '"%s"*' % words[-1]
+
+
+def search(text, limit=20, marks=("<mark>", "</mark>")):
+    """
+    Searches the names, titles, schools and bios of every profile, best matches first (bm25, with name
+    weighted highest). Returns (kind, id, role, name, title, school, snippet) rows where name, title and
+    school are highlighted with marks and snippet is the best matching fragment of the bio.
+    """
+    expression = matchExpression(text)
+    if expression is None:
+        return []
+    return query(
+        "SELECT kind, rowid / 4, role, highlight(people_search, 2, ?, ?), highlight(people_search, 3, ?, ?), "
+        "highlight(people_search, 4, ?, ?), snippet(people_search, 5, ?, ?, '...', 16) "
+        "FROM people_search WHERE people_search MATCH ? ORDER BY bm25(people_search, 0, 0, 10.0, 4.0, 2.0, 1.0) LIMIT ?",
+        marks * 4 + (expression, limit))
+
+
+def execute(sql, params=()):
+    """
+    Runs a single write statement in its own transaction and commits it.
+    """
+    started = time.perf_counter()
+    conn = getConnection()
+    with conn:
+        conn.execute(sql, params)
+    timed(sql, started)
+    # PRAGMA data_version does not change for a connection's own commits.
+    _local.versions = None
+
+
+def executeMany(statements):
+    """
+    Runs each (sql, rows) pair with executemany, all in one transaction: either every row is written or none is.
+    """
+    started = time.perf_counter()
+    conn = getConnection()
+    with conn:
+        for sql, rows in statements:
+            conn.executemany(sql, rows)
+    timed("executemany", started)
+    _local.versions = None
+
+
+def iterate(sql, params=(), size=500):
+    """
+    Runs a SELECT and yields its rows, fetching size rows at a time instead of all of them at once.
+    """
+    cursor = getConnection().execute(sql, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def tableVersions():
+    """
+    Returns {table: (version, updated)} for the VERSIONED_TABLES, re-reading data_version only when
+    another connection has committed since the last call on this thread, or this thread has written.
+    """
+    conn = getConnection()
+    dataVersion = conn.execute("PRAGMA data_version").fetchone()[0]
+    if _local.versions is None or _local.data_version != dataVersion:
+        _local.versions = {name: (version, updated) for name, version, updated in conn.execute("SELECT name, version, updated FROM data_version")}
+        _local.data_version = dataVersion
+    return _local.versions
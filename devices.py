@@ -0,0 +1,69 @@
+import functools
+
+"""
+    User-agent classification.
+
+    Sorts a User-Agent header into one of the device classes the page layouts care about and flags
+    crawlers. A site sees the same few hundred browser strings over and over, so results are kept in
+    an LRU cache and the substring rules only run once per distinct header.
+
+    The result depends on nothing but the header, so it is safe to share between threads; the
+    per-request answer itself lives in flask.g (see flask_app.get_device_type).
+"""
+
+# Classes returned by classify(). Tablets get the mobile layout, like iPads always have.
+MOBILE = "mobile"
+TABLET = "tablet"
+DESKTOP = "desktop"
+UNKNOWN = "unknown"
+
+# Substrings (of the lower-cased header) that mark each class, checked in this order.
+BOT_MARKERS = (
+    "bot", "crawl", "spider", "slurp", "archiver", "facebookexternalhit", "embedly", "preview",
+    "headlesschrome", "lighthouse", "curl/", "wget/", "python-requests", "python-urllib", "go-http-client",
+)
+TABLET_MARKERS = ("ipad", "kindle", "silk/", "playbook", "sm-t", "nexus 7", "nexus 9", "nexus 10")
+MOBILE_MARKERS = ("iphone", "ipod", "mobile", "windows phone", "iemobile", "blackberry", "bb10", "opera mini", "webos")
+# Chrome OS is matched as the token "; CrOS " that its browsers send, since "cros" alone also occurs inside other words.
+DESKTOP_MARKERS = ("windows", "macintosh", "mac os x", "; cros ", "x11", "linux", "freebsd", "openbsd")
+
+# Only this much of the header is looked at, which also bounds the memory the cache can use.
+MAX_LENGTH = 512
+
+
+@functools.lru_cache(maxsize=1024)
+def _classify(userAgent):
+    if any(marker in userAgent for marker in TABLET_MARKERS):
+        device = TABLET
+    elif "android" in userAgent:
+        # Android phones say "Mobile"; Android tablets leave it out.
+        device = MOBILE if "mobile" in userAgent else TABLET
+    elif any(marker in userAgent for marker in MOBILE_MARKERS):
+        device = MOBILE
+    elif any(marker in userAgent for marker in DESKTOP_MARKERS):
+        device = DESKTOP
+    else:
+        device = UNKNOWN
+    return device, any(marker in userAgent for marker in BOT_MARKERS)
+
+
+def classify(userAgent):
+    """
+    Returns (device class, is a bot) for a User-Agent header. Crawlers that announce a phone (such as
+    Googlebot Smartphone) are classed as mobile, so they index the layout phones get.
+    """
+    return _classify((userAgent or "")[:MAX_LENGTH].lower())
+
+
+def isMobileLayout(device):
+    """
+    Tells whether the device class gets the mobile page layout.
+    """
+    return device in (MOBILE, TABLET)
+
+
+def cacheInfo():
+    """
+    Returns the hit/miss statistics of the classification cache.
+    """
+    return _classify.cache_info()
@@ -0,0 +1,99 @@
+import shutil
+import json
+import os
+
+import compression
+
+"""
+    Static export of the public pages.
+
+    flask_app.exportSite() renders every public page once per layout and hands the HTML to writePage(),
+    which stores it as <output>/<layout>/<path>/index.html next to precompressed .br/.gz siblings.
+    copyTree() mirrors the fingerprinted assets and profile photos into <output>/static/. A front-end
+    server picks the layout directory from the User-Agent (see the README for an nginx example), so the
+    public site can be served without touching Flask.
+
+    The export is incremental. The state file remembers what each page was rendered from (the release
+    tag and the versions of its tables), and only pages whose inputs changed are rendered again.
+"""
+
+# A User-Agent for each page layout, sent when rendering that layout's copy of the pages.
+LAYOUTS = {
+    "desktop": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "mobile": "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1",
+}
+
+STATE_NAME = "export.json"
+
+
+def pagePath(output, layout, path):
+    """
+    Returns the file a page is exported to: / -> <output>/<layout>/index.html, /coi -> <output>/<layout>/coi/index.html
+    """
+    return os.path.join(output, layout, *[part for part in path.split("/") if part], "index.html")
+
+
+def writeFile(path, data):
+    """
+    Writes data under a temporary name and moves it into place, so a server never sends half a file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".part", "wb") as file:
+        file.write(data)
+    os.replace(path + ".part", path)
+
+
+def writePage(output, layout, path, html):
+    """
+    Stores the rendered page and its .br/.gz siblings. Returns the path of the page.
+    """
+    destination = pagePath(output, layout, path)
+    writeFile(destination, html)
+    for suffix in compression.ENCODINGS.values():
+        if os.path.exists(destination + suffix):
+            os.remove(destination + suffix)
+    compression.precompress(destination)
+    return destination
+
+
+def copyTree(source, destination, skip=()):
+    """
+    Copies the files under source that are missing from destination or differ in size or modification time.
+    Directories whose path relative to source is in skip are left out. Returns the number of files copied.
+    """
+    copied = 0
+    for root, directories, files in os.walk(source):
+        relative = os.path.relpath(root, source).replace(os.sep, "/")
+        relative = "" if relative == "." else relative + "/"
+        directories[:] = [d for d in directories if relative + d not in skip]
+        for name in files:
+            if name.endswith(".part"):
+                continue
+            origin = os.path.join(root, name)
+            target = os.path.join(destination, *relative.split("/"), name)
+            status = os.stat(origin)
+            if os.path.exists(target) and os.path.getsize(target) == status.st_size and os.path.getmtime(target) == status.st_mtime:
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(origin, target + ".part")
+            os.replace(target + ".part", target)
+            copied += 1
+    return copied
+
+
+def loadState(output):
+    """
+    Returns {page path: inputs it was rendered from} as saved by the last export, or an empty dict.
+    """
+    try:
+        with open(os.path.join(output, STATE_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def saveState(output, state):
+    """
+    Saves the state for the next export.
+    """
+    writeFile(os.path.join(output, STATE_NAME), json.dumps(state, indent=1, sort_keys=True).encode())
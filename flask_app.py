@@ -1,12 +1,31 @@
-from flask import Flask, render_template, request, redirect, session, url_for
+from flask import Flask, Request, g, render_template, request, redirect, session, url_for, get_template_attribute, jsonify, send_from_directory, make_response, stream_with_context, stream_template
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from markupsafe import Markup
-from PIL import Image
+import collections
+import functools
+import cProfile
+import mimetypes
+import re
+import click
+import threading
 import datetime
-import sqlite3
 import hashlib
+import base64
+import time
+import json
 import os
 
+import database
+import devices
+import roster
+import bulk
+import export
+import metrics
+import images
+import assets
+import compression
+
 """
     Author: Taylor J. Brown
     Date: 13MAR24
@@ -19,28 +38,494 @@ current_date = datetime.date.today()
 current_year = current_date.year
 
 app = Flask(__name__)
-app.secret_key = "It changes all the time"
 
-#/home/ImpactISL/mysite/static/images/
-upload_folder = "/home/ImpactISL/mysite/static/images/"
+# Settings applied by configureApp(), with the environment variable that overrides each one and its default.
+# By default the database (SQLite) and the uploaded photos live next to this file, as on the deployed site.
+settings = {
+    "SECRET_KEY": ("IMPACT_SECRET_KEY", "It changes all the time"),
+    "DB_PATH": ("IMPACT_DB_PATH", os.path.join(app.root_path, 'Impact.db')),
+    "UPLOAD": ("IMPACT_UPLOAD_FOLDER", os.path.join(app.static_folder, 'images') + os.sep),
+    "PHOTO_WORKERS": ("IMPACT_PHOTO_WORKERS", 2),
+    # Seconds between checks for assets rebuilt by `flask build-assets` in another process.
+    "RELEASE_CHECK_INTERVAL": ("IMPACT_RELEASE_CHECK_INTERVAL", 5.0),
+    # Seconds between checks for table and photo changes made by other processes (see pageVersions).
+    "VERSION_CHECK_INTERVAL": ("IMPACT_VERSION_CHECK_INTERVAL", 1.0),
+    # Folder the public pages are re-exported to after admin edits (see exportSite). Empty to only export by hand.
+    "EXPORT_FOLDER": ("IMPACT_EXPORT_FOLDER", ""),
+    # Token that lets a scraper read /metrics (as "Authorization: Bearer <token>"); logged-in admins always can.
+    "METRICS_TOKEN": ("IMPACT_METRICS_TOKEN", ""),
+    # 1 lets anyone profile a request with the X-Profile header; otherwise only logged-in admins can.
+    "PROFILING": ("IMPACT_PROFILING", 0),
+    # Largest request body, in MB, accepted by the profile forms and by /importProfiles (which carries a ZIP of photos).
+    "MAX_UPLOAD_MB": ("IMPACT_MAX_UPLOAD_MB", 10.0),
+    "MAX_IMPORT_MB": ("IMPACT_MAX_IMPORT_MB", 200.0),
+    # 1 sends the public pages' preloads as a 103 Early Hints response where the server offers that. Off by default:
+    # clients such as http.client, requests and urllib take a 103 for the final response.
+    "EARLY_HINTS": ("IMPACT_EARLY_HINTS", 0),
+}
+
+
+def configureApp(config=None):
+    """
+    Applies the settings, taking each one from config, then from its environment variable, then from its default.
+    """
+    for name, (variable, default) in settings.items():
+        app.config[name] = type(default)((config or {}).get(name, os.environ.get(variable, default)))
+    app.secret_key = app.config['SECRET_KEY']
+    database.configure(app.config['DB_PATH'])
+    images.configure(app.config['PHOTO_WORKERS'])
+
+
+configureApp()
+
+
+# Views whose file fields take a single profile photo.
+photo_endpoints = {'addProfile', 'editProfile'}
+
+
+class UploadRequest(Request):
+    """
+    Caps the request body at MAX_UPLOAD_MB (MAX_IMPORT_MB for /importProfiles), so Werkzeug refuses a larger one
+    from its Content-Length before reading it, and streams the photos sent to the profile forms into
+    images.PhotoUpload, which refuses a file that is not a photo from its first bytes.
+    """
+    @property
+    def max_content_length(self):
+        limit = app.config['MAX_IMPORT_MB'] if self.endpoint == 'importProfiles' else app.config['MAX_UPLOAD_MB']
+        return int(limit * 1024 * 1024)
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint not in photo_endpoints:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        if filename and not allowed_file(secure_filename(filename)):
+            raise images.PhotoRejected("Photos must be .png, .jpg or .jpeg files.")
+        return images.PhotoUpload(self.max_content_length)
+
+
+app.request_class = UploadRequest
+
+
+@app.errorhandler(images.PhotoRejected)
+def rejectPhoto(error):
+    """
+    Tells the admin why an uploaded photo was refused.
+    """
+    return app.response_class("%s\n" % error, status=400, mimetype='text/plain')
+
+
+metrics.describe("impact_request_duration_seconds", "histogram", "Time spent handling requests, by endpoint, method, status and client (bot or browser).")
+metrics.describe("impact_sql_duration_seconds", "histogram", "Time spent running SQL statements, by statement.")
+metrics.describe("impact_page_render_seconds", "histogram", "Time spent rendering public pages on a page cache miss.")
+metrics.describe("impact_profile_render_seconds", "histogram", "Time spent rendering profile cards and table rows, by macro.")
+metrics.describe("impact_photo_processing_seconds", "histogram", "Time spent processing uploaded photos, by folder and status.")
+metrics.describe("impact_page_cache_requests_total", "counter", "Page cache lookups, by result.")
+metrics.describe("impact_conditional_requests_total", "counter", "Public page requests answered with 304 Not Modified or a full page.")
+metrics.describe("impact_compression_cache_requests_total", "counter", "Compressed body cache lookups, by result.")
+metrics.describe("impact_user_agent_cache_requests_total", "counter", "User-Agent classification cache lookups, by result.")
+metrics.describe("impact_page_cache_entries", "gauge", "Pages currently held in the page cache.")
+metrics.describe("impact_photo_jobs", "gauge", "Tracked photo jobs, by status.")
+
+
+@app.before_request
+def startRequest():
+    """
+    Notes when the request started and, when asked for with the X-Profile header and allowed, starts profiling it.
+    """
+    g.started = time.perf_counter()
+    g.profiler = None
+    if request.headers.get('X-Profile') and (app.config['PROFILING'] or 'admin' in session):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def finishRequest(response):
+    """
+    Records the request's latency. A profiled request gets the profile report instead of its normal body.
+    Registered first, so it runs after every other after_request function.
+    """
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        response = app.response_class(metrics.profileReport(profiler), mimetype='text/plain')
+    if 'started' in g:
+        metrics.observe("impact_request_duration_seconds", time.perf_counter() - g.started,
+                        endpoint=request.endpoint or "none", method=request.method, status=response.status_code,
+                        client="bot" if g.get('is_bot') else "browser")
+    return response
+
+
+@app.teardown_request
+def stopProfiler(error=None):
+    """
+    Stops the profiler of a request that failed before after_request ran.
+    """
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
 
-app.config['UPLOAD'] = upload_folder
+def recordStatement(sql, seconds):
+    metrics.observe("impact_sql_duration_seconds", seconds, statement=statementLabel(sql))
 
-# Path to the database file (The database used is SQLite and is stored in the same directory as the flask app).
-db_path = '/home/ImpactISL/mysite/Impact.db'
 
+@functools.lru_cache(maxsize=256)
+def statementLabel(sql):
+    """
+    Shortens a SQL statement to a metric label: whitespace collapsed, at most 120 characters.
+    """
+    return " ".join(sql.split())[:120]
+
+
+database.on_statement.append(recordStatement)
 
-# Get the user's device type and assign it to a global variable.
+
+# Classify the user's device once per request and keep the result in flask.g, where the views and templates read it.
+# Whether it is a bot labels the request metrics, so crawler traffic can be told apart from visitors.
 @app.before_request
 def get_device_type():
-    global user_device_type
-    user_agent = request.user_agent.string.lower()
-    if "android" in user_agent or "iphone" in user_agent or "ipad" in user_agent:
-        user_device_type = "mobile"
-    elif "windows" in user_agent or "macos" in user_agent:
-        user_device_type = "desktop"
-    else:
-        user_device_type = "unknown"
+    g.device_type, g.is_bot = devices.classify(request.headers.get('User-Agent'))
+
+
+def isMobile():
+    """
+    Tells whether the current request gets the mobile layout.
+    """
+    return devices.isMobileLayout(g.device_type)
+
+
+# Rendered public roster pages keyed by (route, mobile layout). Admin writes clear it through invalidatesPageCache;
+# writes and photo jobs of other workers are noticed through the table and photo versions the pages were rendered against.
+page_cache = {}
+page_cache_lock = threading.Lock()
+page_cache_generation = 0
+page_cache_versions = None
+# Characters of a streamed page beyond which it is sent without being cached.
+page_cache_max_size = 4 * 1024 * 1024
+
+
+def cachedPage(view):
+    """
+    Serves the view from the page cache, rendering and storing it on a miss.
+    A page rendered while the cache was being cleared is returned but not stored.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        versions = pageVersions()
+        if versions != page_cache_versions:
+            clearPageCache(versions)
+
+        key = (request.path, isMobile())
+        page = page_cache.get(key)
+        if page is not None:
+            metrics.increment("impact_page_cache_requests_total", result="hit")
+            return page
+        metrics.increment("impact_page_cache_requests_total", result="miss")
+
+        generation = page_cache_generation
+        started = time.perf_counter()
+        page = view(*args, **kwargs)
+        if not isinstance(page, str):
+            return cacheStream(page, key, generation, started, request.endpoint)
+        metrics.observe("impact_page_render_seconds", time.perf_counter() - started, endpoint=request.endpoint)
+        with page_cache_lock:
+            if generation == page_cache_generation:
+                page_cache[key] = page
+        return page
+    return wrapper
+
+
+def cacheStream(chunks, key, generation, started, endpoint):
+    """
+    Passes a streamed page through and caches it once it has been sent in full. Pages larger than
+    page_cache_max_size are not kept, so they never have to be held in memory whole.
+    """
+    collected, size = [], 0
+    for chunk in chunks:
+        if collected is not None:
+            collected.append(chunk)
+            size += len(chunk)
+            if size > page_cache_max_size:
+                collected = None
+        yield chunk
+    metrics.observe("impact_page_render_seconds", time.perf_counter() - started, endpoint=endpoint)
+    if collected is not None:
+        with page_cache_lock:
+            if generation == page_cache_generation:
+                page_cache[key] = "".join(collected)
+
+
+def clearPageCache(versions=None):
+    """
+    Drops every cached page so the next request re-renders from the current roster snapshot.
+    versions records the table and photo versions the pages rendered from now on belong to.
+    """
+    global page_cache_generation, page_cache_versions
+    with page_cache_lock:
+        page_cache_generation += 1
+        page_cache_versions = versions
+        page_cache.clear()
+
+
+def releaseInfo():
+    """
+    Returns a tag identifying the current templates and built assets, and the time they last changed.
+    Pages change with a deploy even when no table does, so the tag is part of every page's ETag.
+    """
+    digest = hashlib.sha1()
+    newest = 0
+    templates = os.path.join(app.root_path, app.template_folder)
+    for root, directories, files in os.walk(templates):
+        for name in sorted(files):
+            modified = os.path.getmtime(os.path.join(root, name))
+            digest.update(("%s:%d" % (os.path.join(root, name), modified)).encode())
+            newest = max(newest, modified)
+    digest.update(repr(sorted(asset_manifest.items())).encode())
+    return digest.hexdigest()[:12], int(newest)
+
+
+def photoVersions():
+    """
+    Returns {table: version of its profile photos' variants}. Pages list the variants that exist when they are
+    rendered, so a photo job finishing changes them without any table changing.
+    """
+    return {table: images.variantsVersion(os.path.join(app.config['UPLOAD'], spec["folder"])) for table, spec in bulk.TABLES.items()}
+
+
+# (page cache generation, time, versions) of the last read of pageVersions().
+page_versions = (None, 0.0, None)
+
+
+def pageVersions():
+    """
+    Returns (database.tableVersions(), photoVersions()), reading them again at most every VERSION_CHECK_INTERVAL
+    seconds, or right after this worker changed something (clearPageCache() starts a new generation).
+    In between, pages are checked against them without touching SQLite or the photo folders.
+    """
+    global page_versions
+    generation, checked, versions = page_versions
+    now = time.monotonic()
+    if generation != page_cache_generation or now - checked >= app.config['VERSION_CHECK_INTERVAL']:
+        generation = page_cache_generation
+        versions = (database.tableVersions(), photoVersions())
+        page_versions = (generation, now, versions)
+    return versions
+
+
+# Tables each public page is built from, by endpoint. Filled in by conditionalPage and used by the static export.
+page_tables = {}
+
+
+def conditionalPage(*tables):
+    """
+    Tags the page with an ETag and Last-Modified derived from the versions of the tables it is built from and
+    of their photos' variants (see pageVersions), and answers If-None-Match / If-Modified-Since with a 304 before the page is looked up or rendered.
+    """
+    def decorator(view):
+        page_tables[view.__name__] = tables
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            versions, photos = pageVersions()
+            tag, released = release_info
+            etag = hashlib.sha1(repr((request.path, isMobile(), tag, [versions[table] for table in tables], [photos[table] for table in tables])).encode()).hexdigest()[:20]
+            lastModified = max([versions[table][1] for table in tables] + [photos[table] // 10 ** 9 for table in tables] + [released])
+
+            if request.if_none_match:
+                notModified = request.if_none_match.contains_weak(etag)
+            else:
+                notModified = request.if_modified_since is not None and request.if_modified_since.timestamp() >= lastModified
+
+            metrics.increment("impact_conditional_requests_total", result="not_modified" if notModified else "full")
+            if notModified:
+                response = app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            # Weak, because the compressed and uncompressed bodies share the tag.
+            response.set_etag(etag, weak=True)
+            response.last_modified = lastModified
+            response.cache_control.no_cache = True
+            response.vary.add('User-Agent')
+            return response
+        return wrapper
+    return decorator
+
+
+def invalidatesPageCache(view):
+    """
+    Rebuilds the roster snapshot and clears the page cache after the view handles a POST, whichever branch it returns from.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            return view(*args, **kwargs)
+        finally:
+            if request.method == 'POST':
+                roster.refresh()
+                clearPageCache()
+                scheduleExport()
+    return wrapper
+
+
+# Resources each page needs for its first paint, as (static path, as, type) tuples keyed by (endpoint, mobile layout):
+# its stylesheet bundle, the fonts of its critical CSS and its device-sized background. Built from page_templates
+# and the asset build by loadRelease, and sent as Link headers and Early Hints (see preloadLinks).
+page_preloads = {}
+# Template each page renders, by endpoint.
+page_templates = {
+    'index': 'index.html',
+    'copi': 'copi.html',
+    'principleInvestigator': 'principleInvestigator.html',
+    'jplResearchers': 'jpl_researchers.html',
+    'students': 'students.html',
+    'admin': 'admin.html',
+    'adminLogin': 'adminLogin.html',
+}
+
+# Content-hashed names of the static assets and the device-sized page backgrounds, both written by `flask build-assets`.
+# Empty until the assets have been built. loadRelease() replaces them whole, so a request never sees a half-loaded one.
+asset_manifest = {}
+hero_images = {}
+critical_styles = {}
+release_info = (None, 0)
+release_stamp = None
+release_checked = 0.0
+
+
+def releaseStamp():
+    """
+    Returns the modification times of the asset and background manifests, which change with every build.
+    """
+    stamp = []
+    for path in (os.path.join(app.static_folder, assets.BUILD_DIRECTORY, assets.MANIFEST_NAME),
+                 os.path.join(app.static_folder, 'images', images.HERO_DIRECTORY, images.HERO_MANIFEST)):
+        try:
+            stamp.append(os.path.getmtime(path))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+# A page template's background, as in {{ hero.background('name.jpg', ...) }}.
+HERO_PATTERN = re.compile(r"""hero\.background\(\s*['"]([^'"]+)['"]""")
+
+
+def pagePreloads():
+    """
+    Returns the preloads of every page in page_templates with a built stylesheet bundle, for page_preloads.
+    Browsers without WebP skip a background preload of type image/webp and fetch the JPEG once the page has loaded.
+    """
+    stylesheets = {os.path.basename(template): name for name, (template, sources) in
+                   assets.findBundles(os.path.join(app.root_path, app.template_folder)).items() if name.endswith('.css')}
+    preloads = {}
+    for endpoint, templateName in page_templates.items():
+        name = stylesheets.get(templateName)
+        path = name and assets.BUNDLE_DIRECTORY + '/' + name
+        if path not in asset_manifest:
+            continue
+        template = os.path.join(app.root_path, app.template_folder, templateName)
+        links = [(path, 'style', None)] + [(font, 'font', 'font/woff2') for font in critical_styles.get(name, ('', []))[1]]
+        with open(template, encoding='utf-8') as file:
+            backgrounds = [hero_images[hero] for hero in HERO_PATTERN.findall(file.read()) if hero in hero_images]
+        for mobile in (False, True):
+            variants = [(hero['mobile' if mobile else 'desktop'] + '.webp', 'image', 'image/webp') for hero in backgrounds]
+            preloads[(endpoint, mobile)] = tuple(links + variants)
+    return preloads
+
+
+def loadRelease():
+    """
+    Loads the manifests of the last asset build and drops the pages rendered against the previous ones.
+    """
+    global asset_manifest, hero_images, critical_styles, page_preloads, release_info, release_stamp
+    release_stamp = releaseStamp()
+    asset_manifest = assets.loadManifest(app.static_folder)
+    hero_images = images.loadHeroes(os.path.join(app.static_folder, 'images'))
+    critical_styles = assets.loadCritical(app.static_folder, asset_manifest)
+    page_preloads = pagePreloads()
+    release_info = releaseInfo()
+    clearPageCache()
+
+
+loadRelease()
+
+
+@app.before_request
+def checkRelease():
+    """
+    Switches to newly built assets without restarting the worker, looking at most every RELEASE_CHECK_INTERVAL seconds.
+    """
+    global release_checked
+    now = time.monotonic()
+    if now - release_checked >= app.config['RELEASE_CHECK_INTERVAL']:
+        release_checked = now
+        if releaseStamp() != release_stamp:
+            loadRelease()
+
+
+@app.url_defaults
+def hashedStaticUrls(endpoint, values):
+    """
+    Points url_for('static', filename=...) at the fingerprinted copy of the file, when there is one.
+    """
+    manifest = asset_manifest
+    if endpoint == 'static' and values.get('filename') in manifest:
+        values['filename'] = manifest[values['filename']]
+
+
+@app.after_request
+def cacheHashedAssets(response):
+    """
+    Lets browsers keep fingerprinted assets and content-addressed profile photos for a year without revalidating.
+    Their names change whenever their content does.
+    """
+    filename = request.view_args.get('filename', '') if request.endpoint == 'static' else ''
+    fingerprinted = filename.startswith(assets.BUILD_DIRECTORY + '/') or (filename.startswith('images/') and images.isContentAddressed(os.path.basename(filename)))
+    if fingerprinted and response.status_code in (200, 304):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@app.after_request
+def compressResponse(response):
+    """
+    Compresses text responses with brotli or gzip, whichever the client accepts. Streamed responses are compressed chunk by chunk.
+    """
+    if response.mimetype in compression.COMPRESSIBLE_TYPES:
+        response.vary.add('Accept-Encoding')
+    if compression.shouldCompress(response):
+        encoding = compression.negotiate(request.headers.get('Accept-Encoding'))
+        if encoding:
+            response.set_data(compression.compressCached(response.get_data(), encoding))
+            response.headers['Content-Encoding'] = encoding
+    elif compression.shouldCompressStream(response):
+        encoding = compression.negotiate(request.headers.get('Accept-Encoding'))
+        if encoding:
+            response.response = compression.compressStream(response.response, encoding)
+            response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def sendStaticFile(filename):
+    """
+    Serves a static file, or its precompressed .br/.gz sibling from `flask build-assets` when the client accepts it.
+    """
+    if filename.endswith(compression.COMPRESSIBLE_EXTENSIONS):
+        path = safe_join(app.static_folder, filename)
+        available = [encoding for encoding, suffix in compression.ENCODINGS.items() if path and os.path.isfile(path + suffix)]
+        encoding = compression.negotiate(request.headers.get('Accept-Encoding'), available)
+        if encoding:
+            response = send_from_directory(app.static_folder, filename + compression.ENCODINGS[encoding], mimetype=mimetypes.guess_type(filename)[0], max_age=app.get_send_file_max_age(filename))
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = app.send_static_file(filename)
+        response.vary.add('Accept-Encoding')
+        return response
+    return app.send_static_file(filename)
+
+
+app.view_functions['static'] = sendStaticFile
+
 
 # filter acceptable image file extensions
 def allowed_file(filename):
@@ -48,6 +533,8 @@ def allowed_file(filename):
 
 
 @app.route('/')
+@conditionalPage()
+@cachedPage
 def index():
     """
     Renders the index.html template with the current year.
@@ -56,53 +543,85 @@ def index():
 
 
 @app.route('/coi')
+@conditionalPage('faculty')
+@cachedPage
 def copi():
     """
-    Renders the faculty.html template with the faculty data populated from the database and the current year.
+    Renders the faculty.html template with the faculty data from the roster snapshot and the current year.
     """
     faculty = facultyPopulate('copi')
-    if user_device_type == "mobile":
+    if isMobile():
         return render_template('copi.html', faculty=faculty, current_year=current_year, TitleFontSize="50px")
     else:
         return render_template('copi.html', faculty=faculty, current_year=current_year, TitleFontSize="105px")
 
 @app.route('/principalInvestigator')
+@conditionalPage('faculty')
+@cachedPage
 def principleInvestigator():
     """
-    Renders the faculty.html template with the faculty data populated from the database and the current year.
+    Renders the faculty.html template with the faculty data from the roster snapshot and the current year.
     """
     faculty = facultyPopulate('pi')
-    if user_device_type == "mobile":
+    if isMobile():
         return render_template('principleInvestigator.html', faculty=faculty, current_year=current_year, TitleFontSize="50px")
     else:
         return render_template('principleInvestigator.html', faculty=faculty, current_year=current_year, TitleFontSize="105px")
 
 
 @app.route('/jplResearchers')
+@conditionalPage('jpl')
+@cachedPage
 def jplResearchers():
     """
-    Renders the jpl_researchers.html template with the JPL researchers data populated from the database and the current year.
+    Renders the jpl_researchers.html template with the JPL researchers data from the roster snapshot and the current year.
     """
     jpl = jplPopulate()
-    if user_device_type == "mobile":
+    if isMobile():
         return render_template('jpl_researchers.html', jpl=jpl, current_year=current_year, TitleFontSize="45px")
     else:
         return render_template('jpl_researchers.html', jpl=jpl, current_year=current_year, TitleFontSize="105px")
 
 
 @app.route('/students')
+@conditionalPage('students')
+@cachedPage
 def students():
     """
-    Renders the students.html template with the student data populated from the database based on the school and the current year.
+    Streams the students.html template with one section per school of the roster snapshot, each rendered
+    stream_rows cards at a time, and the current year.
     """
-    FSU = populateStudents("FSU")
-    NCCU = populateStudents("NCCU")
-    WSSU = populateStudents("WSSU")
-    Alumni = populateStudents("Alumni")
-    if user_device_type == "mobile":
-        return render_template('students.html', current_year=current_year, TitleFontSize="65px", FSU=FSU, NCCU=NCCU, WSSU=WSSU, Alumni=Alumni)
+    mobile = isMobile()
+    schools = ((heading, renderProfileChunks('studentCards', rows, mobile)) for heading, rows in studentsBySchool())
+    if mobile:
+        return streamPage('students.html', current_year=current_year, TitleFontSize="65px", schools=schools)
     else:
-        return render_template('students.html', current_year=current_year, TitleFontSize="105px", FSU=FSU, NCCU=NCCU, WSSU=WSSU, Alumni=Alumni)
+        return streamPage('students.html', current_year=current_year, TitleFontSize="105px", schools=schools)
+
+
+@app.route('/search')
+def searchProfiles():
+    """
+    Searches the name, title, school and bio of every faculty member, JPL researcher and student.
+    Returns the best matches first as JSON. name, title, school and snippet are HTML (as stored, like on the
+    roster pages) with the matched words wrapped in <mark>; page is where the profile is shown.
+    """
+    text = request.args.get('q', '')[:200]
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+
+    results = []
+    for kind, id, role, name, title, school, snippet in database.search(text, limit):
+        results.append({"kind": kind, "id": id, "name": name, "title": title, "school": school, "snippet": snippet, "page": profilePage(kind, role)})
+    return jsonify({"results": results})
+
+
+def profilePage(kind, role):
+    """
+    Returns the URL of the roster page a search result appears on.
+    """
+    if kind == "faculty":
+        return url_for('copi' if role == 'copi' else 'principleInvestigator')
+    return url_for('jplResearchers' if kind == "jpl" else 'students')
 
 
 @app.route('/admin')
@@ -111,17 +630,192 @@ def admin():
     Renders the admin.html template if the admin is logged in.
     """
     if 'admin' in session:
-        facultyRows = facultyPopulateTable()
-        jplRows = jplPopulateTable()
-        studentsRows = populateStudentsTable()
-
         sessionID = session['adminID']
 
-        return render_template('admin.html', current_year=current_year, facultyRows=facultyRows, jplRows=jplRows, studentsRows=studentsRows, sessionID=sessionID)
+        return render_template('admin.html', current_year=current_year, sessionID=sessionID)
     else:
         return redirect(url_for('adminLogin'))
 
 
+@app.route('/photoStatus')
+def photoStatus():
+    """
+    Returns the status of the recently uploaded profile photos as JSON for the admin page.
+    """
+    if 'admin' in session:
+        return jsonify(images.recentJobs())
+    else:
+        return jsonify([]), 403
+
+
+@app.route('/metrics')
+def metricsPage():
+    """
+    Returns the metrics of this worker process in the Prometheus text format. Readable by logged-in admins
+    and with the METRICS_TOKEN bearer token. Where the request comes from is not trusted: behind the reverse
+    proxy every request arrives from this machine.
+    """
+    token = app.config['METRICS_TOKEN']
+    if not ('admin' in session or (token and request.headers.get('Authorization') == 'Bearer ' + token)):
+        return app.response_class("Forbidden\n", status=403, mimetype='text/plain')
+    return app.response_class(metrics.render(), mimetype='text/plain', headers={'Cache-Control': 'no-store'})
+
+
+def collectMetrics():
+    """
+    Reports the statistics that the caches and the photo queue keep themselves.
+    """
+    agents = devices.cacheInfo()
+    yield "impact_user_agent_cache_requests_total", {"result": "hit"}, agents.hits
+    yield "impact_user_agent_cache_requests_total", {"result": "miss"}, agents.misses
+    yield "impact_compression_cache_requests_total", {"result": "hit"}, compression.cache_stats["hits"]
+    yield "impact_compression_cache_requests_total", {"result": "miss"}, compression.cache_stats["misses"]
+    yield "impact_page_cache_entries", {}, len(page_cache)
+    jobs = collections.Counter(job["status"] for job in images.recentJobs())
+    for status in ("queued", "processing", "done", "failed"):
+        yield "impact_photo_jobs", {"status": status}, jobs[status]
+
+
+metrics.addCollector(collectMetrics)
+
+
+# Tables served page by page to the admin page by /api/<table>: the key column, the column names in SELECT * order,
+# the sort keys a client may ask for (mapped to SQL expressions; nullable columns are wrapped so the keyset
+# comparison never meets a NULL), the columns searched by q, the columns accepted as exact filters and the
+# profiles.html macro that renders the rows.
+admin_tables = {
+    "faculty": {
+        "key": "FID",
+        "columns": ("FID", "name", "title", "school", "email", "bio", "image", "link", "role"),
+        "sort": {"id": "FID", "name": "name", "title": "title", "school": "school", "email": "email", "role": "role"},
+        "search": ("name", "title", "school", "email"),
+        "filters": ("school", "role"),
+        "macro": "facultyTableRows",
+    },
+    "jpl": {
+        "key": "RID",
+        "columns": ("RID", "name", "title", "location", "email", "bio", "image"),
+        "sort": {"id": "RID", "name": "name", "title": "title", "location": "location", "email": "email"},
+        "search": ("name", "title", "location", "email"),
+        "filters": ("location",),
+        "macro": "jplTableRows",
+    },
+    "students": {
+        "key": "SID",
+        "columns": ("SID", "name", "student_tier", "image", "school", "email"),
+        "sort": {"id": "SID", "name": "name", "tier": "student_tier", "school": "school", "email": "email"},
+        "search": ("name", "student_tier", "school", "email"),
+        "filters": ("school", "student_tier"),
+        "macro": "studentTableRows",
+    },
+}
+
+# Default and largest number of rows per page. Kept even so the striped rows alternate across page boundaries.
+api_page_size = 50
+api_max_page_size = 200
+
+
+def encodeCursor(cursor):
+    """
+    Packs a keyset cursor into an opaque, URL-safe string.
+    """
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode().rstrip("=")
+
+
+def decodeCursor(text):
+    """
+    Unpacks a cursor made by encodeCursor. Raises ValueError when it is malformed.
+    """
+    cursor = json.loads(base64.urlsafe_b64decode(text + "=" * (-len(text) % 4)))
+    # The sort value is null where the column is (see database.keysetPage); the key never is.
+    if not isinstance(cursor, list) or len(cursor) != 2 or not isinstance(cursor[0], (str, int, float, type(None))) or not isinstance(cursor[1], (str, int, float)):
+        raise ValueError("bad cursor")
+    return cursor
+
+
+@app.route('/api/<table>')
+def apiTable(table):
+    """
+    Returns one page of the faculty, jpl or students table as JSON for the admin tables.
+    Query parameters: limit, sort (see admin_tables), order (asc or desc), after (the "next" cursor of the previous page),
+    q (text searched for in the name, title, school and email columns), exact filters such as school, and html=1 to
+    also get the rows rendered as admin table rows.
+    """
+    if 'admin' not in session:
+        return jsonify({"error": "Not logged in."}), 403
+    spec = admin_tables.get(table)
+    if spec is None:
+        return jsonify({"error": "Unknown table."}), 404
+
+    sort = request.args.get('sort', 'id')
+    if sort not in spec["sort"]:
+        return jsonify({"error": "Cannot sort by %s." % sort}), 400
+    try:
+        after = decodeCursor(request.args['after']) if request.args.get('after') else None
+    except ValueError:
+        return jsonify({"error": "Invalid cursor."}), 400
+    limit = min(max(request.args.get('limit', api_page_size, type=int), 1), api_max_page_size)
+
+    where, params = [], []
+    text = request.args.get('q', '').strip()
+    if text:
+        pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        where.append("(" + " OR ".join("%s LIKE ? ESCAPE '\\'" % column for column in spec["search"]) + ")")
+        params.extend([pattern] * len(spec["search"]))
+    for column in spec["filters"]:
+        if column in request.args:
+            where.append("%s = ?" % column)
+            params.append(request.args[column])
+
+    rows, cursor = database.keysetPage(table, spec["key"], spec["sort"][sort], request.args.get('order') == 'desc', after, limit, where, params)
+
+    result = {"rows": [dict(zip(spec["columns"], row)) for row in rows], "next": encodeCursor(cursor)}
+    if request.args.get('html'):
+        result["html"] = str(renderProfiles(spec["macro"], rows))
+    return jsonify(result)
+
+
+@app.route('/importProfiles', methods=['POST'])
+@invalidatesPageCache
+def importProfiles():
+    """
+    Imports profiles from an uploaded CSV or JSON file (form field "file") and, optionally, a ZIP archive of their
+    photos ("photos"). "table" names the table a CSV file or a JSON list is for. Nothing is written unless every
+    row validates; the response lists the problems found, or the number of rows imported per table.
+    """
+    if 'admin' not in session:
+        return jsonify({"error": "Not logged in."}), 403
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({"errors": ["Choose a CSV or JSON file to import."]}), 400
+    archive = request.files.get('photos')
+    format = 'csv' if upload.filename.lower().endswith('.csv') else 'json'
+    try:
+        counts, jobs = importRecords(upload.read(), format, request.form.get('table'), archive.read() if archive else None)
+    except bulk.ImportFailed as error:
+        return jsonify({"errors": error.errors}), 400
+    return jsonify({"imported": counts, "photos": jobs})
+
+
+@app.route('/exportProfiles')
+def exportProfiles():
+    """
+    Streams the faculty, jpl or students table ("table", or "all" for every table) as CSV or JSON ("format").
+    A JSON export can be imported again as it is.
+    """
+    if 'admin' not in session:
+        return jsonify({"error": "Not logged in."}), 403
+    table = request.args.get('table', 'all')
+    format = request.args.get('format', 'json')
+    if format not in ('csv', 'json') or (table not in bulk.TABLES and table != 'all') or (table == 'all' and format == 'csv'):
+        return jsonify({"error": "Export a single table as CSV, or one or all tables as JSON."}), 400
+    chunks = exportChunks(table, format)
+    return app.response_class(stream_with_context(chunks), mimetype='text/csv' if format == 'csv' else 'application/json', headers={
+        'Content-Disposition': 'attachment; filename=impact-%s.%s' % (table, format), 'Cache-Control': 'no-store'})
+
+
 @app.route('/adminLogin', methods=['POST', 'GET'])
 def adminLogin():
     """
@@ -149,6 +843,7 @@ def adminLogout():
 
 
 @app.route('/addProfile', methods=['GET', 'POST'])
+@invalidatesPageCache
 def addProfile():
     """
     Renders the add_profile.html template and handles the form submission for adding faculty, JPL researchers, and students.
@@ -164,12 +859,9 @@ def addProfile():
             filename = secure_filename(photo.filename)
             link = request.form['link']
             if photo and allowed_file(filename):
-                saveFacultyPhoto(photo, filename)
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO faculty (FID, name, title, school, email, bio, image, link) VALUES (NULL,?,?,?,?,?,?,?)", (name, title, school, email, bio, filename, link))
-                conn.commit()
-                conn.close()
+                with photo_rows_lock:
+                    filename = saveFacultyPhoto(photo, filename)
+                    database.execute("INSERT INTO faculty (FID, name, title, school, email, bio, image, link) VALUES (NULL,?,?,?,?,?,?,?)", (name, title, school, email, bio, filename, link))
                 return redirect(url_for('admin'))
         elif request.form['profileType'] == "jpl":
             name = request.form['name']
@@ -180,12 +872,9 @@ def addProfile():
             photo = request.files['photo']
             filename = secure_filename(photo.filename)
             if photo and allowed_file(filename):
-                saveJPLPhoto(photo, filename)
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO jpl (RID, name, title, location, email, bio, image) VALUES (NULL,?,?,?,?,?,?)", (name, title, location, email, bio, filename))
-                conn.commit()
-                conn.close()
+                with photo_rows_lock:
+                    filename = saveJPLPhoto(photo, filename)
+                    database.execute("INSERT INTO jpl (RID, name, title, location, email, bio, image) VALUES (NULL,?,?,?,?,?,?)", (name, title, location, email, bio, filename))
                 return redirect(url_for('admin'))
         elif request.form['profileType'] == "student":
             name = request.form['name']
@@ -195,18 +884,16 @@ def addProfile():
             school = request.form.get('school')
             email = request.form['email']
             if photo and allowed_file(filename):
-                saveStudentPhoto(photo, filename)
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO students (SID, name, student_tier, image, school, email) VALUES (NULL,?,?,?,?,?)", (name, tier, filename, school, email))
-                conn.commit()
-                conn.close()
+                with photo_rows_lock:
+                    filename = saveStudentPhoto(photo, filename)
+                    database.execute("INSERT INTO students (SID, name, student_tier, image, school, email) VALUES (NULL,?,?,?,?,?)", (name, tier, filename, school, email))
                 return redirect(url_for('admin'))
 
     return redirect(url_for('admin'))
 
 
 @app.route('/editProfile', methods=['GET', 'POST'])
+@invalidatesPageCache
 def editProfile():
     """
     Renders the edit_profile.html template and handles the form submission for editing faculty, JPL researchers, and students.
@@ -223,19 +910,14 @@ def editProfile():
             link = request.form['link']
             id = request.form['facultyModalid']
             if photo and allowed_file(filename):
-                saveFacultyPhoto(photo, filename)
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("UPDATE faculty SET name=?, title=?, school=?, email=?, bio=?, image=?, link=? WHERE FID=?", (name, title, school, email, bio, filename, link, id))
-                conn.commit()
-                conn.close()
+                with photo_rows_lock:
+                    previous = database.queryOne("SELECT image FROM faculty WHERE FID=?", (id,))
+                    filename = saveFacultyPhoto(photo, filename)
+                    database.execute("UPDATE faculty SET name=?, title=?, school=?, email=?, bio=?, image=?, link=? WHERE FID=?", (name, title, school, email, bio, filename, link, id))
+                    rememberPreviousPhoto('faculty', id, previous, filename)
                 return redirect(url_for('admin'))
             else:
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("UPDATE faculty SET name=?, title=?, school=?, email=?, bio=?, link=? WHERE FID=?", (name, title, school, email, bio, link, id))
-                conn.commit()
-                conn.close()
+                database.execute("UPDATE faculty SET name=?, title=?, school=?, email=?, bio=?, link=? WHERE FID=?", (name, title, school, email, bio, link, id))
                 return redirect(url_for('admin'))
 
         elif request.form['profileType'] == "jpl":
@@ -248,19 +930,14 @@ def editProfile():
             filename = secure_filename(photo.filename)
             id = request.form['jplModalid']
             if photo and allowed_file(filename):
-                saveJPLPhoto(photo, filename)
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("UPDATE jpl SET name=?, title=?, location=?, email=?, bio=?, image=? WHERE RID=?", (name, title, location, email, bio, filename, id))
-                conn.commit()
-                conn.close()
+                with photo_rows_lock:
+                    previous = database.queryOne("SELECT image FROM jpl WHERE RID=?", (id,))
+                    filename = saveJPLPhoto(photo, filename)
+                    database.execute("UPDATE jpl SET name=?, title=?, location=?, email=?, bio=?, image=? WHERE RID=?", (name, title, location, email, bio, filename, id))
+                    rememberPreviousPhoto('jpl', id, previous, filename)
                 return redirect(url_for('admin'))
             else:
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("UPDATE jpl SET name=?, title=?, location=?, email=?, bio=? WHERE RID=?", (name, title, location, email, bio, id))
-                conn.commit()
-                conn.close()
+                database.execute("UPDATE jpl SET name=?, title=?, location=?, email=?, bio=? WHERE RID=?", (name, title, location, email, bio, id))
                 return redirect(url_for('admin'))
 
         elif request.form['profileType'] == "student":
@@ -272,24 +949,20 @@ def editProfile():
             email = request.form['email']
             id = request.form['studentModalid']
             if photo and allowed_file(filename):
-                saveStudentPhoto(photo, filename)
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("UPDATE students SET name=?, student_tier=?, image=?, school=?, email=? WHERE SID=?", (name, tier, filename, school, email, id))
-                conn.commit()
-                conn.close()
+                with photo_rows_lock:
+                    previous = database.queryOne("SELECT image FROM students WHERE SID=?", (id,))
+                    filename = saveStudentPhoto(photo, filename)
+                    database.execute("UPDATE students SET name=?, student_tier=?, image=?, school=?, email=? WHERE SID=?", (name, tier, filename, school, email, id))
+                    rememberPreviousPhoto('students', id, previous, filename)
                 return redirect(url_for('admin'))
             else:
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("UPDATE students SET name=?, student_tier=?, school=?, email=? WHERE SID=?", (name, tier, school, email, id))
-                conn.commit()
-                conn.close()
+                database.execute("UPDATE students SET name=?, student_tier=?, school=?, email=? WHERE SID=?", (name, tier, school, email, id))
                 return redirect(url_for('admin'))
 
     return redirect(url_for('admin'))
 
 @app.route('/deleteProfile', methods=['POST'])
+@invalidatesPageCache
 def deleteProfile():
     """
     Deletes a profile from the database.
@@ -297,28 +970,16 @@ def deleteProfile():
     if request.method == 'POST':
         if request.form['deleteType'] == "faculty":
             id = request.form['deleteModalID']
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM faculty WHERE FID=?", (id,))
-            conn.commit()
-            conn.close()
+            database.execute("DELETE FROM faculty WHERE FID=?", (id,))
             print()
             return redirect(url_for('admin'))
         elif request.form['deleteType'] == "jpl":
             id = request.form['deleteModalID']
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM jpl WHERE RID=?", (id,))
-            conn.commit()
-            conn.close()
+            database.execute("DELETE FROM jpl WHERE RID=?", (id,))
             return redirect(url_for('admin'))
         elif request.form['deleteType'] == "student":
             id = request.form['deleteModalID']
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM students WHERE SID=?", (id,))
-            conn.commit()
-            conn.close()
+            database.execute("DELETE FROM students WHERE SID=?", (id,))
             return redirect(url_for('admin'))
 
     return redirect(url_for('admin'))
@@ -327,61 +988,292 @@ def deleteProfile():
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~Methods~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def resizeImage(photo):
+# Photos the profile edits replaced, by (folder, stored name) of the new photo while it is processed: [(table, id, previous
+# image)]. Form handlers hold photo_rows_lock while they store a photo and write the row naming it, so a job that fails
+# right away is not handled before the row exists (see restorePhotos).
+previous_photos = collections.defaultdict(list)
+photo_rows_lock = threading.Lock()
+
+
+def rememberPreviousPhoto(table, id, previous, name):
     """
-    Makes the image square and resizes it to the specified width and height.
+    Remembers the image an edit replaced with the photo stored as name, for as long as that photo is being processed.
+    previous is the row's image column as read before the edit. Call it with photo_rows_lock held.
     """
-    photo = photo.resize((500, 500))
-    return photo
+    folder = bulk.TABLES[table]["folder"]
+    if previous and previous[0] and previous[0] != name and not os.path.exists(os.path.join(app.config['UPLOAD'], folder, name)):
+        previous_photos[(folder, name)].append((table, id, previous[0]))
 
 
-def saveFacultyPhoto(photo, name):
+def restorePhotos(job):
     """
-    Saves the faculty photo to the static/images/Faculty directory.
+    When a photo could not be processed, points the profiles naming it back at the image an edit replaced,
+    or at none, so that no profile names a photo that was never written.
     """
-    photo.save(os.path.join(app.config['UPLOAD'], "Faculty", name))
+    with photo_rows_lock:
+        previous = previous_photos.pop((job["folder"], job["file"]), [])
+        if job["status"] != "failed" or os.path.exists(os.path.join(app.config['UPLOAD'], job["folder"], job["file"])):
+            return
+        statements = []
+        for table, spec in bulk.TABLES.items():
+            if spec["folder"] == job["folder"]:
+                rows = [(image, id, job["file"]) for edited, id, image in previous if edited == table]
+                statements.append(("UPDATE %s SET image = ? WHERE %s = ? AND image = ?" % (table, spec["key"]), rows))
+                statements.append(("UPDATE %s SET image = NULL WHERE image = ?" % table, [(job["file"],)]))
+        database.executeMany(statements)
+    roster.refresh()
+    clearPageCache()
+    scheduleExport()
 
-    # Open the image and resize it
-    photo = Image.open(os.path.join(app.config['UPLOAD'], "Faculty", name))
-    photo = resizeImage(photo)
-    photo.save(os.path.join(app.config['UPLOAD'], "Faculty", name))
+
+def saveFacultyPhoto(photo, name):
+    """
+    Queues the faculty photo to be processed into the static/images/Faculty directory. Returns the name it is stored under.
+    """
+    return images.storePhoto(photo.read(), os.path.join(app.config['UPLOAD'], "Faculty"), name)[0]
 
 
 def saveJPLPhoto(photo, name):
     """
-    Saves the JPL photo to the static/images/JPL directory.
+    Queues the JPL photo to be processed into the static/images/JPL directory. Returns the name it is stored under.
     """
-    photo.save(os.path.join(app.config['UPLOAD'], "JPL", name))
+    return images.storePhoto(photo.read(), os.path.join(app.config['UPLOAD'], "JPL"), name)[0]
 
-    # Open the image and resize it
-    photo = Image.open(os.path.join(app.config['UPLOAD'], "JPL", name))
-    photo = resizeImage(photo)
-    photo.save(os.path.join(app.config['UPLOAD'], "JPL", name))
 
+def saveStudentPhoto(photo, name):
+    """
+    Queues the student photo to be processed into the static/images/Students directory. Returns the name it is stored under.
+    """
+    return images.storePhoto(photo.read(), os.path.join(app.config['UPLOAD'], "Students"), name)[0]
 
 
-def saveStudentPhoto(photo, name):
+def importRecords(data, format, table=None, archive=None):
+    """
+    Validates and imports the profiles in a CSV or JSON file (see bulk.py). The rows of every table are inserted
+    in one transaction, then the photos from the archive are queued on the photo worker pool, which processes
+    them in parallel. Returns ({table: rows imported}, [photo jobs]).
+    """
+    def photoExists(folder, name):
+        return os.path.isfile(os.path.join(app.config['UPLOAD'], folder, name))
+
+    rows, photos = bulk.prepare(bulk.parseRecords(data, format, table), archive, photoExists)
+    database.executeMany([(bulk.insertStatement(name), values) for name, values in rows.items()])
+    jobs = [images.storePhoto(photo, os.path.join(app.config['UPLOAD'], folder), name)[1] for folder, name, photo in photos]
+    return {name: len(values) for name, values in rows.items()}, [job for job in jobs if job]
+
+
+def exportChunks(table, format):
+    """
+    Yields an export of one table (or, as JSON, of every table when table is "all") read a batch of rows at a time.
+    """
+    def rows(name):
+        return database.iterate("SELECT %s FROM %s ORDER BY %s" % (", ".join(bulk.exportColumns(name)), name, bulk.TABLES[name]["key"]))
+
+    if format == 'csv':
+        return bulk.streamCsv(table, rows(table))
+    names = list(bulk.TABLES) if table == 'all' else [table]
+    return bulk.streamJson((name, rows(name)) for name in names)
+
+
+@app.template_global()
+def photoSources(folder, image):
+    """
+    Returns the srcset data for the resized variants of a profile photo, or None if it has none yet.
+    Used by the macros in templates/partials/profiles.html.
+    """
+    if not image:
+        return None
+    return images.variantSources(os.path.join(app.config['UPLOAD'], folder, image), "static/images/%s/%s" % (folder, image))
+
+
+# Pages embed the variants that exist when they are rendered, so re-render them once a photo has been processed.
+images.on_complete.append(lambda job: clearPageCache())
+images.on_complete.append(lambda job: scheduleExport())
+images.on_finish.append(lambda job: metrics.observe("impact_photo_processing_seconds", job["seconds"], folder=job["folder"], status=job["status"]))
+images.on_finish.append(restorePhotos)
+
+
+@app.cli.command('backfill-photos')
+@click.option('--resize-originals', is_flag=True, help="Also crop and resize stored photos that are not 500x500.")
+def backfillPhotos(resize_originals):
+    """
+    Generates the resized WebP/JPEG variants for every profile photo already on disk.
+    """
+    for table, spec in bulk.TABLES.items():
+        count, renamed = images.backfillVariants(os.path.join(app.config['UPLOAD'], spec["folder"]), resize_originals)
+        if renamed:
+            database.executeMany([("UPDATE %s SET image = ? WHERE image = ?" % table, [(new, old) for old, new in renamed.items()])])
+        click.echo("%s: %d photos, %d renamed" % (spec["folder"], count, len(renamed)))
+    roster.refresh()
+    clearPageCache()
+
+
+@app.cli.command('import-profiles')
+@click.argument('file', type=click.File('rb'))
+@click.option('--table', type=click.Choice(list(bulk.TABLES)), help="The table a CSV file or a JSON list is for.")
+@click.option('--photos', type=click.File('rb'), help="ZIP archive of the photos the rows name.")
+def importProfilesCommand(file, table, photos):
+    """
+    Imports the profiles in a CSV or JSON FILE, with their photos, and waits for the photos to be processed.
+    """
+    format = 'csv' if file.name.lower().endswith('.csv') else 'json'
+    try:
+        counts, jobs = importRecords(file.read(), format, table, photos.read() if photos else None)
+    except bulk.ImportFailed as error:
+        for problem in error.errors:
+            click.echo(problem, err=True)
+        raise click.ClickException(str(error))
+    for name, count in counts.items():
+        click.echo("%s: %d rows" % (name, count))
+    failed = [job for job in images.waitForJobs(jobs) if job["status"] == "failed"]
+    for job in failed:
+        click.echo("%s/%s: %s" % (job["folder"], job["file"], job["error"]), err=True)
+    click.echo("%d photos processed, %d failed" % (len(jobs) - len(failed), len(failed)))
+    clearPageCache()
+    scheduleExport()
+
+
+@app.cli.command('export-profiles')
+@click.option('--table', type=click.Choice(list(bulk.TABLES) + ['all']), default='all')
+@click.option('--format', type=click.Choice(['json', 'csv']), default='json')
+@click.argument('output', type=click.File('w'), default='-')
+def exportProfilesCommand(table, format, output):
+    """
+    Writes the profiles to OUTPUT (default: standard output) as JSON, or one table as CSV.
+    """
+    if table == 'all' and format == 'csv':
+        raise click.UsageError("Choose a --table to export as CSV.")
+    for chunk in exportChunks(table, format):
+        output.write(chunk)
+
+
+@app.cli.command('gc-photos')
+@click.option('--dry-run', is_flag=True, help="Only list the files that would be removed.")
+@click.option('--min-age', type=float, default=3600, show_default=True, help="Keep files changed within this many seconds.")
+def collectPhotos(dry_run, min_age):
+    """
+    Removes the profile photos, and their variants, that no profile refers to any more.
+    """
+    for table, spec in bulk.TABLES.items():
+        referenced = {image for image, in database.query("SELECT DISTINCT image FROM %s WHERE image IS NOT NULL" % table)}
+        removed = images.collectGarbage(os.path.join(app.config['UPLOAD'], spec["folder"]), referenced, min_age, dry_run)
+        for path in removed if dry_run else ():
+            click.echo(path)
+        click.echo("%s: %d files %s" % (spec["folder"], len(removed), "unused" if dry_run else "removed"))
+
+
+@app.template_global()
+def heroBackground(name):
+    """
+    Returns the background image to use for the current device: the URLs of its JPEG and WebP copies and
+    the inline placeholder shown while they load. Before the assets are built, only the original is returned.
+    """
+    hero = hero_images.get(name)
+    if hero is None:
+        return {'placeholder': None, 'jpeg': url_for('static', filename='images/' + name), 'webp': None}
+    variant = hero['mobile'] if isMobile() else hero['desktop']
+    return {
+        'placeholder': hero['placeholder'],
+        'jpeg': url_for('static', filename=variant + '.jpg'),
+        'webp': url_for('static', filename=variant + '.webp'),
+    }
+
+
+@app.template_global()
+def bundle(name, caller):
+    """
+    Replaces the tags of a {% call bundle(name) %} block with the single tag of the page's built bundle
+    (see assets.buildBundles). Before the assets are built, the block's own tags are returned.
+
+    A stylesheet bundle with critical rules (a template with a {# fold #} marker) is not linked but inlined
+    as those rules, and the whole bundle is loaded without blocking the first paint.
+    """
+    path = assets.BUNDLE_DIRECTORY + '/' + name
+    if path not in asset_manifest:
+        return caller()
+    href = url_for('static', filename=path)
+    if not name.endswith('.css'):
+        return Markup('<script src="%s"></script>' % href)
+
+    critical = critical_styles.get(name)
+    if critical is None:
+        return Markup('<link rel="stylesheet" href="%s">' % href)
+    css = critical[0]
+    static = url_for('static', filename='')
+    css = assets.URL_PATTERN.sub(lambda match: match.group(0) if ':' in match.group(2) or match.group(2).startswith(('/', '#')) else 'url(%s)' % (static + match.group(2)), css)
+    return Markup('<style>%s</style>\n'
+                  '    <link rel="preload" href="%s" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">\n'
+                  '    <noscript><link rel="stylesheet" href="%s"></noscript>') % (Markup(css.replace('</', '<\\/')), href, href)
+
+
+def preloadLinks():
+    """
+    Returns the Link: rel=preload values for the current request's page, if it has any.
+    """
+    if 'device_type' not in g or request.method != 'GET':
+        return []
+    links = []
+    for path, kind, type in page_preloads.get((request.endpoint, isMobile()), ()):
+        link = '<%s>; rel=preload; as=%s' % (url_for('static', filename=path), kind)
+        if type:
+            link += '; type="%s"' % type
+        if kind == 'font':
+            link += '; crossorigin'
+        links.append(link)
+    return links
+
+
+@app.before_request
+def sendEarlyHints():
+    """
+    Sends the page's preloads as a 103 Early Hints response before it is rendered, when EARLY_HINTS is set
+    and the server offers that through the wsgi.early_hints environ key.
     """
-    Saves the student photo to the static/images/Students directory.
+    earlyHints = request.environ.get('wsgi.early_hints') if app.config['EARLY_HINTS'] else None
+    links = preloadLinks() if earlyHints else None
+    if links:
+        earlyHints([('Link', link) for link in links])
+
+
+@app.after_request
+def preloadHeaders(response):
+    """
+    Adds the page's preloads as a Link header. CDNs that support Early Hints send them as one from this header.
+    """
+    links = preloadLinks()
+    if links and response.status_code == 200 and response.mimetype == 'text/html':
+        response.headers['Link'] = ', '.join(links)
+    return response
+
+
+def buildRelease():
     """
-    photo.save(os.path.join(app.config['UPLOAD'], "Students", name))
+    Writes the background image variants and the static assets, and loads them. Says so when the icon fonts
+    are shipped whole because the packages that subset them are missing.
+    """
+    images.buildHeroes(os.path.join(app.static_folder, 'images'))
+    assets.buildAssets(app.static_folder, os.path.join(app.root_path, app.template_folder), [__file__])
+    missing = assets.missingPackages()
+    if missing:
+        click.echo("Icon fonts not subset, install %s (see requirements.txt)" % " and ".join(missing), err=True)
+    loadRelease()
 
-    # Open the image and resize it
-    photo = Image.open(os.path.join(app.config['UPLOAD'], "Students", name))
-    photo = resizeImage(photo)
-    photo.save(os.path.join(app.config['UPLOAD'], "Students", name))
 
+@app.cli.command('build-assets')
+def buildAssets():
+    """
+    Writes the background image variants, then content-hashed copies of the static assets and the manifest
+    that url_for resolves them through.
+    """
+    buildRelease()
+    click.echo("%d assets fingerprinted into static/%s" % (len(asset_manifest), assets.BUILD_DIRECTORY))
 
 
 def adminLoginDef(username, password):
     """
     Logs the admin into the admin page if the username and password are correct.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM admin WHERE username=?", (username,))
-    data = cursor.fetchone()
-    conn.close()
+    data = database.queryOne("SELECT * FROM admin WHERE username=?", (username,))
 
     # Compare the hashed password with the password in the database
     if data:
@@ -428,253 +1320,125 @@ def populateErrorModal(message):
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 def facultyPopulate(role):
     """
-    Retrieves faculty data from the database and assembles the HTML markup for each faculty member.
-    Returns the assembled HTML markup as a string.
+    Takes the faculty with the role from the roster snapshot and renders the profile card for each faculty member.
+    Returns the rendered HTML markup.
     """
-    faculty = []
-    factultyassembled = ""
+    faculty = roster.current().faculty_by_role.get('copi' if role == 'copi' else 'pi', ())
 
-    if role == 'copi':
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM faculty WHERE role LIKE 'copi'")
-        for row in cursor.fetchall():
-            faculty.append(row)
-        conn.close()
-    else:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM faculty WHERE role LIKE 'pi'")
-        for row in cursor.fetchall():
-            faculty.append(row)
-        conn.close()
-
-    if user_device_type == "mobile":
+    if isMobile():
         width = "250px"
         height = "250px"
     else:
         width = "400px"
         height = "400px"
 
-    for i in range(len(faculty)):
-        factultyassembled += Markup("""
-            <div class="row">
-                <div class="col-md-6 col-xxl-12" style="text-align: center;background: var(--bs-body-bg);width: 100%;margin: auto;padding-bottom: 76px;">
-                    <img class="rounded-circle teamprofilepictures" style="overflow: hidden;width: initial;" width="Width" height="Height" src="static/images/Faculty/Photo">
-                    <a href="Link" target="_blank"><h1 class="teamprofilenames">Name</h1></a>
-                    <h1 class="teamprofileprofessions" style="color: rgb(128, 128, 128);">Title</h1>
-                    <h1 class="teamprofileprofessions" style="color: rgb(128, 128, 128);">School</h1>
-                    <h1 class="teamprofileprofessions" style="color: rgb(128, 128, 128);font-size: 16px;">Email</h1>
-                    <p class="teamprofiledescription"><span style="color: rgb(0, 0, 0);">Bio</span></p>
-                </div>
-            </div>
-        """.replace("Name", faculty[i][1]).replace("Title", faculty[i][2]).replace("School", faculty[i][3]).replace("Email", faculty[i][4]).replace("Bio", faculty[i][5])).replace("Photo", faculty[i][6]).replace("Link", faculty[i][7]).replace("Width", width).replace("Height", height)
-
-    return factultyassembled
-
-def facultyPopulateTable():
-    """
-    Retrieves faculty data from the database and assembles the HTML markup for each faculty member.
-    Returns the assembled HTML markup as a string.
-    """
-    faculty = []
-    factultyassembled = ""
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM faculty")
-    for row in cursor.fetchall():
-        faculty.append(row)
-    conn.close()
-
-    count = 0
-
-    for i in range(len(faculty)):
-        if count % 2 == 0:
-            factultyassembled += Markup("""<tr style="background: #262a38;">""")
-        else:
-            factultyassembled += Markup("""<tr style="background: #212430;">""")
-
-        factultyassembled += Markup("""
-                <td style="color: var(--bs-table-color);" id="IDfacultyname" value="Name">Name<br></td>
-                <td style="color: var(--bs-table-color);" id="IDfacultytitle" value="Title">Title</td>
-                <td style="color: var(--bs-table-color);" id="IDfacultyschool" value="School">School</td>
-                <td style="color: var(--bs-table-color);" id="IDfacultyemail" value="Email">Email</td>
-                <td style="color: var(--bs-table-color);font-size: 10px;" id="IDfacultybio">Bio</td>
-                <td style="color: var(--bs-table-color);" id="IDfacultyimage" value="Image">Image</td>
-                <td style="color: var(--bs-table-color);font-size: 10px;" id="IDfacultylink" value="Link">Link</td>
-                <td class="text-center align-middle" style="max-height: 60px;height: 60px;width: 100px;">
-                    <a class="btn btnMaterial btn-flat success semicircle" role="button" href="#" style="color: rgb(0,197,179);" onclick="editFaculty(ID)"><i class="fas fa-pen"></i></a>
-                    <a class="btn btnMaterial btn-flat accent btnNoBorders checkboxHover" role="button" style="margin-left: 5px;" onclick="promptDelete(ID, 'faculty')"  href="#">
-                        <i class="fas fa-trash btnNoBorders" style="color: #DC3545;"></i></a></td>
-            </tr>
-        """.replace("ID", str(faculty[i][0])).replace("Name", faculty[i][1]).replace("Title", faculty[i][2]).replace("School", faculty[i][3]).replace("Email", faculty[i][4]).replace("Bio", faculty[i][5])).replace("Image", faculty[i][6]).replace("Link", faculty[i][7])
-        count += 1
-
-    return factultyassembled
+    return renderProfiles('facultyCards', faculty, width, height)
 
 
 def jplPopulate():
     """
-    Retrieves JPL data from the database and assembles the HTML markup for each JPL researcher.
-    Returns the assembled HTML markup as a string.
+    Takes the JPL researchers from the roster snapshot and renders the profile card for each of them.
+    Returns the rendered HTML markup.
     """
-    jpl = []
-    jplassembled = ""
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM jpl")
-    for row in cursor.fetchall():
-        jpl.append(row)
-    conn.close()
+    jpl = roster.current().jpl
 
-    if user_device_type == "mobile":
+    if isMobile():
         width = "250px"
         height = "250px"
     else:
         width = "400px"
         height = "400px"
 
-    for i in range(len(jpl)):
-        jplassembled += Markup("""
-            <div class="row">
-                <div class="col-md-6 col-xxl-12" style="text-align: center;background: var(--bs-body-bg);width: 100%;margin: auto;padding-bottom: 76px;">
-                    <img class="rounded-circle teamprofilepictures" style="overflow: hidden;width: initial;" width="Width" height="Height" src="static/images/JPL/Photo">
-                    <h1 class="teamprofilenames">Name</h1>
-                    <h1 class="teamprofileprofessions" style="color: rgb(128, 128, 128);">Title</h1>
-                    <h1 class="teamprofileprofessions" style="color: rgb(128, 128, 128);">Location</h1>
-                    <h1 class="teamprofileprofessions" style="color: rgb(128, 128, 128);font-size: 16px;">Email</h1>
-                    <p class="teamprofiledescription"><span style="color: rgb(0, 0, 0);">Bio</span></p>
-                </div>
-            </div>
-        """.replace("Name", jpl[i][1]).replace("Title", jpl[i][2]).replace("Location", jpl[i][3]).replace("Email", jpl[i][4]).replace("Bio", jpl[i][5])).replace("Photo", jpl[i][6]).replace("Width", width).replace("Height", height)
-
-    return jplassembled
-
-def jplPopulateTable():
-    """
-    Retrieves JPL data from the database and assembles the HTML markup for each JPL researcher.
-    Returns the assembled HTML markup as a string.
-    """
-    jpl = []
-    jplassembled = ""
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM jpl")
-    for row in cursor.fetchall():
-        jpl.append(row)
-    conn.close()
-
-    count = 0
-
-    for i in range(len(jpl)):
-        if count % 2 == 0:
-            jplassembled += Markup("""<tr style="background: #262a38;">""")
-        else:
-            jplassembled += Markup("""<tr style="background: #212430;">""")
-
-        jplassembled += Markup("""
-            <td style="color: var(--bs-table-color);" id="IDjplname" value="Name">Name<br></td>
-            <td style="color: var(--bs-table-color);" id="IDjpltitle" value="Title">Title</td>
-            <td style="color: var(--bs-table-color);" id="IDjpllocation" value="Location">Location</td>
-            <td style="color: var(--bs-table-color);" id="IDjplemail" value="Email">Email</td>
-            <td style="color: var(--bs-table-color);font-size: 12px;" id="IDjplbio">Bio</td>
-            <td style="color: var(--bs-table-color);" id="IDjplImage" value="Image">Image</td>
-            <td class="text-center align-middle" style="max-height: 60px;height: 60px;width: 100px;">
-                <a class="btn btnMaterial btn-flat success semicircle" role="button" href="#" style="color: rgb(0,197,179);" onclick="editJPL(ID)"><i class="fas fa-pen"></i></a>
-                <a class="btn btnMaterial btn-flat accent btnNoBorders checkboxHover" role="button" style="margin-left: 5px;" onclick="promptDelete(ID, 'jpl')"  href="#">
-                    <i class="fas fa-trash btnNoBorders" style="color: #DC3545;"></i></a></td>
-        </tr>
-        """.replace("ID", str(jpl[i][0])).replace("Name", jpl[i][1]).replace("Title", jpl[i][2]).replace("Location", jpl[i][3]).replace("Email", jpl[i][4]).replace("Bio", jpl[i][5])).replace("Image", jpl[i][6])
-        count += 1
-
-    return jplassembled
+    return renderProfiles('jplCards', jpl, width, height)
+
+
+# Section headings for the schools on the students page, in display order. Schools found in the table
+# that are not listed here get their own section, titled with the school value, ahead of the Alumni.
+school_headings = {
+    "FSU": "Fayetteville State University",
+    "NCCU": "NC Central University",
+    "WSSU": "Winston-Salem State University",
+    "Alumni": "Alumni",
+}
+
+
+def studentsBySchool():
+    """
+    Groups the students of the roster snapshot by school, in display order.
+    Returns a list of (heading, rows) pairs.
+    """
+    groups = roster.current().students_by_school
+    extra = sorted(school for school in groups if school not in school_headings and school)
+    order = [school for school in school_headings if school != "Alumni"] + extra + ["Alumni"]
+    return [(school_headings.get(school, school), groups.get(school, ())) for school in order]
 
 
 def populateStudents(school):
     """
-    Retrieves student data from the database based on the school and assembles the HTML markup for each student.
-    Returns the assembled HTML markup as a string.
-    """
-    students = []
-    students_assembled = ""
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM students WHERE school=?", (school,))
-    for row in cursor.fetchall():
-        students.append(row)
-    conn.close()
-
-    if user_device_type == "mobile":
-        for i in range(len(students)):
-            students_assembled += Markup("""
-                        <div class="col">
-                            <div class="card border-0 shadow-none">
-                                <div class="card-body text-center d-flex flex-column align-items-center p-0">
-                                    <img class="rounded-circle mb-3 fit-cover" width="130" height="130" src="static/images/Students/Photo" alt="https://cdn.bootstrapstudio.io/placeholders/1400x800.png">
-                                    <h5 class="fw-bold text-primary card-title mb-0"><strong>Name</strong></h5>
-                                    <p class="text-muted card-text mb-2" style="font-size:8px;">Email<br>Tier</p>
-                                </div>
-                            </div>
-                        </div>
-            """.replace("Name", students[i][1]).replace("Tier", students[i][2])).replace("Photo", students[i][3]).replace("Email", students[i][5])
-    else:
-        for i in range(len(students)):
-            students_assembled += Markup("""
-                        <div class="col">
-                            <div class="card border-0 shadow-none">
-                                <div class="card-body text-center d-flex flex-column align-items-center p-0">
-                                    <img class="rounded-circle mb-3 fit-cover" width="130" height="130" src="static/images/Students/Photo" alt="https://cdn.bootstrapstudio.io/placeholders/1400x800.png">
-                                    <h5 class="fw-bold text-primary card-title mb-0"><strong>Name</strong></h5>
-                                    <p class="text-muted card-text mb-2">Email<br>Tier</p>
-                                </div>
-                            </div>
-                        </div>
-            """.replace("Name", students[i][1]).replace("Tier", students[i][2])).replace("Photo", students[i][3]).replace("Email", students[i][5])
+    Takes the students of the school from the roster snapshot and renders the card for each student.
+    Returns the rendered HTML markup.
+    """
+    students = roster.current().students_by_school.get(school, ())
+
+    return renderProfiles('studentCards', students, isMobile())
 
-    return students_assembled
 
-def populateStudentsTable():
+def renderProfiles(macro, rows, *args):
     """
-    Retrieves student data from the database based on the school and assembles the HTML markup for each student.
-    Returns the assembled HTML markup as a string.
+    Renders the rows with one of the macros in templates/partials/profiles.html.
+    Jinja compiles the partial once and keeps it in its template cache, so each call is a single loop over the rows.
     """
-    students = []
-    students_assembled = ""
+    started = time.perf_counter()
+    html = get_template_attribute('partials/profiles.html', macro)(rows, *args)
+    metrics.observe("impact_profile_render_seconds", time.perf_counter() - started, macro=macro)
+    return html
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM students")
-    for row in cursor.fetchall():
-        students.append(row)
-    conn.close()
 
-    count = 0
+def renderProfileChunks(macro, rows, *args):
+    """
+    Renders the rows with one of the profiles.html macros stream_rows at a time, yielding the HTML of each batch.
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == stream_rows:
+            yield renderProfiles(macro, batch, *args)
+            batch = []
+    if batch:
+        yield renderProfiles(macro, batch, *args)
 
-    for i in range(len(students)):
-        if count % 2 == 0:
-            students_assembled += Markup("""<tr style="background: #262a38;">""")
-        else:
-            students_assembled += Markup("""<tr style="background: #212430;">""")
 
-        students_assembled += Markup("""
-            <td style="color: var(--bs-table-color);" id="IDstudentname" value="Name">Name<br></td>
-            <td style="color: var(--bs-table-color);" id="IDstudenttier" value="Tier">Tier</td>
-            <td style="color: var(--bs-table-color);" id="IDstudentphoto" value="Image">Image</td>
-            <td style="color: var(--bs-table-color);" id="IDstudentschool" value="School">School</td>
-            <td style="color: var(--bs-table-color);" id="IDstudentemail" value="Email">Email</td>
-            <td class="text-center align-middle" style="max-height: 60px;height: 60px;width: 100px;">
-                <a class="btn btnMaterial btn-flat success semicircle" role="button" href="#" style="color: rgb(0,197,179);" onclick="editStudent(ID)"><i class="fas fa-pen"></i></a>
-                <a class="btn btnMaterial btn-flat accent btnNoBorders checkboxHover" role="button" style="margin-left: 5px;" onclick="promptDelete(ID, 'student')"  href="#">
-                    <i class="fas fa-trash btnNoBorders" style="color: #DC3545;"></i></a></td>
-        </tr>
-        """.replace("ID", str(students[i][0])).replace("Name", students[i][1]).replace("Tier", students[i][2])).replace("Image", students[i][3]).replace("School", students[i][4]).replace("Email", students[i][5])
-        count += 1
+# Rows rendered per chunk of a streamed page, and the bytes of a streamed page collected before they are sent.
+stream_rows = 100
+stream_buffer_size = 16384
+
 
-    return students_assembled
+def streamPage(name, **context):
+    """
+    Renders a template as a stream of chunks of about stream_buffer_size bytes, so the first bytes go out before
+    the rest of the page is rendered. {{ flush() }} in the template sends what has been rendered so far right away,
+    e.g. the head and hero before the roster cards are rendered.
+    """
+    flushed = []
+
+    def flush():
+        flushed.append(True)
+        return ''
+
+    parts = stream_template(name, flush=flush, **context)
+
+    def chunks():
+        buffer, size = [], 0
+        for part in parts:
+            buffer.append(part)
+            size += len(part)
+            if flushed or size >= stream_buffer_size:
+                yield "".join(buffer)
+                buffer, size = [], 0
+                del flushed[:]
+        if buffer:
+            yield "".join(buffer)
+    return chunks()
 
 
 def createAdmin(username, password):
@@ -683,11 +1447,112 @@ def createAdmin(username, password):
     """
     password = hashlib.sha3_512(password.encode()).hexdigest()
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO admin (AID, username, password) VALUES (NULL,?, ?)", (username, password))
-    conn.commit()
-    conn.close()
+    database.execute("INSERT INTO admin (AID, username, password) VALUES (NULL,?, ?)", (username, password))
+
+
+def exportSite(output, force=False):
+    """
+    Renders the public pages for every layout into output and copies the assets and profile photos they use
+    next to them. Only pages whose tables, photo variants or templates changed since the last export are rendered,
+    unless force.
+    Returns the number of pages rendered and of files copied.
+    """
+    state = {} if force else export.loadState(output)
+    versions = database.tableVersions()
+    photos = photoVersions()
+    client = app.test_client()
+
+    rendered = 0
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint not in page_tables:
+            continue
+        tables = page_tables[rule.endpoint]
+        inputs = json.loads(json.dumps([release_info[0]] + [versions[table] for table in tables] + [photos[table] for table in tables]))
+        if state.get(rule.rule) == inputs:
+            continue
+        for layout, userAgent in export.LAYOUTS.items():
+            response = client.get(rule.rule, headers={'User-Agent': userAgent, 'Accept-Encoding': 'identity'})
+            if response.status_code != 200:
+                raise RuntimeError("%s answered %d" % (rule.rule, response.status_code))
+            export.writePage(output, layout, rule.rule, response.get_data())
+        state[rule.rule] = inputs
+        rendered += 1
+
+    static = os.path.join(output, 'static')
+    if asset_manifest:
+        copied = export.copyTree(os.path.join(app.static_folder, assets.BUILD_DIRECTORY), os.path.join(static, assets.BUILD_DIRECTORY))
+    else:
+        copied = export.copyTree(app.static_folder, static, assets.EXCLUDED)
+    for folder in ("Faculty", "JPL", "Students"):
+        copied += export.copyTree(os.path.join(app.config['UPLOAD'], folder), os.path.join(static, 'images', folder))
+
+    export.saveState(output, state)
+    return rendered, copied
+
+
+export_lock = threading.Lock()
+export_running = False
+export_pending = False
+
+
+def scheduleExport():
+    """
+    Re-exports the public pages in a background thread when EXPORT_FOLDER is set. Edits made while an export
+    is running are picked up by one more export once it finishes.
+    """
+    global export_running, export_pending
+    if not app.config['EXPORT_FOLDER']:
+        return
+    with export_lock:
+        if export_running:
+            export_pending = True
+            return
+        export_running = True
+    threading.Thread(target=runExports, name="export", daemon=True).start()
+
+
+def runExports():
+    global export_running, export_pending
+    while True:
+        try:
+            exportSite(app.config['EXPORT_FOLDER'])
+        except Exception:
+            app.logger.exception("Exporting the public pages failed")
+        with export_lock:
+            if not export_pending:
+                export_running = False
+                return
+            export_pending = False
+
+
+@app.cli.command('export-site')
+@click.argument('output', required=False)
+@click.option('--force', is_flag=True, help="Render every page, not just the ones whose data changed.")
+def exportSiteCommand(output, force):
+    """
+    Builds the assets, then exports the public pages as static files into OUTPUT (default: IMPACT_EXPORT_FOLDER).
+    """
+    output = output or app.config['EXPORT_FOLDER']
+    if not output:
+        raise click.UsageError("Give an output folder or set IMPACT_EXPORT_FOLDER.")
+    buildRelease()
+    rendered, copied = exportSite(output, force)
+    click.echo("%d pages rendered, %d files copied into %s" % (rendered, copied, output))
+
+
+def createApp(config=None):
+    """
+    Returns the app configured for production serving (see wsgi.py). Every template is compiled and the
+    database schema applied up front, so a fresh worker does not make its first visitors wait for either.
+    """
+    configureApp(config)
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    # The connection is only needed for ensureSchema; each worker thread opens its own.
+    database.getConnection()
+    database.close()
+    loadRelease()
+    return app
 
 
 if __name__ == '__main__':
@@ -0,0 +1,31 @@
+import multiprocessing
+import os
+
+"""
+    gunicorn settings for serving wsgi:app. Every value can be overridden from the environment.
+
+    Each worker process runs IMPACT_THREADS threads; pages, the database connection and the device
+    classification are all per request or per thread, so threads share a worker safely.
+
+    Reload gracefully after a deploy with `kill -HUP <master pid>`: new workers start with the new code
+    while the old ones finish the requests they are serving. Admin edits need no reload (cached pages
+    follow the database), and neither does `flask build-assets` (workers pick up the new manifests).
+"""
+
+wsgi_app = "wsgi:app"
+bind = os.environ.get("IMPACT_BIND", "127.0.0.1:8000")
+
+workers = int(os.environ.get("IMPACT_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("IMPACT_THREADS", 8))
+worker_class = "gthread"
+
+# Load the app (templates, schema, manifests) once in the master and fork the workers from it. This saves
+# memory and start-up time, but then HUP no longer loads new code; restart the master to deploy instead.
+preload_app = os.environ.get("IMPACT_PRELOAD", "0") == "1"
+
+# Seconds a worker gets to finish its requests on reload or shutdown.
+graceful_timeout = int(os.environ.get("IMPACT_GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("IMPACT_TIMEOUT", 60))
+keepalive = 5
+
+accesslog = os.environ.get("IMPACT_ACCESS_LOG", "-")
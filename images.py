@@ -0,0 +1,535 @@
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps, ImageFilter
+import hashlib
+import base64
+import json
+import glob
+import collections
+import threading
+import datetime
+import uuid
+import re
+import time
+import io
+import os
+
+"""
+    Background processing for profile photo uploads.
+
+    The request thread only reads the upload into memory and queues a job. A worker pool decodes it
+    from memory, center-crops it to a square, resizes it and writes the result next to the other
+    photos. Pillow releases the GIL while decoding, resampling and encoding, so a thread pool is
+    enough to keep several large phone photos from tying up the web workers.
+
+    Every processed photo also gets smaller variants for the sizes the roster pages display it at,
+    in WebP (and AVIF, when a Pillow AVIF plugin is installed) next to a JPEG/PNG fallback. They are
+    written to a variants/ directory beside the photo and offered to browsers through srcset.
+
+    The large page backgrounds get the same treatment at build time (buildHeroes): a progressive JPEG
+    and a WebP per device class, plus a tiny blurred placeholder that is inlined into the page.
+
+    Photos are stored under a hash of the uploaded bytes (storePhoto). Identical uploads share one file,
+    two people's headshot.jpg no longer overwrite each other, and a stored photo never changes under its
+    name, so browsers may cache it forever. Files no profile refers to any more are removed by
+    collectGarbage().
+
+    Uploads are checked before any pixel is decoded: PhotoUpload receives an upload from the form parser
+    and refuses it as soon as its first bytes are not a PNG or JPEG signature or it grows past the size
+    cap, and checkPhoto() reads only the header to refuse images with too many pixels. Large JPEGs are
+    decoded at a reduced scale (squarePhoto), so a big phone photo never has to be held at full size.
+
+    Job status is kept in memory for the admin page. Under several server processes each one only
+    knows about the jobs it queued itself.
+"""
+
+# Edge length, in pixels, of the stored square profile photos.
+PHOTO_SIZE = 500
+
+# Widths, in pixels, generated for each photo directory. They cover the slots the roster pages use
+# (130px student cards, 250px/400px faculty and JPL cards) at 1x and, where the source allows, 2x.
+VARIANT_WIDTHS = {
+    "Students": (130, 260),
+    "Faculty": (250, 400, 500),
+    "JPL": (250, 400, 500),
+}
+
+VARIANT_DIRECTORY = "variants"
+
+try:
+    import pillow_avif  # noqa: F401  (registers the AVIF codec with Pillow)
+except ImportError:
+    pass
+
+# Load every installed codec plugin so Image.SAVE below lists them.
+Image.init()
+
+# Modern encodings written for every variant, best first, as (format, extension, MIME type, save options).
+MODERN_FORMATS = [entry for entry in [
+    ("AVIF", "avif", "image/avif", {"quality": 50}),
+    ("WEBP", "webp", "image/webp", {"quality": 80, "method": 6}),
+] if entry[0] in Image.SAVE]
+
+# Hex digits of the SHA-256 of the upload that name a stored photo, and the names that start with such a hash
+# (the photo itself and its variants).
+HASH_LENGTH = 32
+HASHED_NAME = re.compile(r"^[0-9a-f]{%d}[._]" % HASH_LENGTH)
+
+# Leading bytes of the accepted photo formats.
+SIGNATURES = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff")
+SIGNATURE_LENGTH = max(map(len, SIGNATURES))
+
+# Largest photo accepted, in pixels, by format. JPEGs are decoded at a reduced scale, other formats in full.
+MAX_PIXELS = {"JPEG": 50000000, "PNG": 16000000}
+DEFAULT_MAX_PIXELS = 16000000
+
+# Anything Pillow decodes, backfills and hero images included, stops with DecompressionBombError beyond twice this.
+Image.MAX_IMAGE_PIXELS = max(MAX_PIXELS.values())
+
+
+class PhotoRejected(Exception):
+    """
+    Raised when an upload is not a photo that can be accepted. The message says why, for the admin.
+    Not a ValueError, which Werkzeug's form parser would swallow.
+    """
+
+
+class PhotoUpload(io.BytesIO):
+    """
+    Memory buffer the form parser streams an uploaded photo into. The upload is refused as soon as its
+    first bytes do not start like a PNG or JPEG, or it grows past maxSize bytes, so the rest of a bad
+    upload is never stored.
+    """
+    def __init__(self, maxSize):
+        super().__init__()
+        self.maxSize = maxSize
+        self.checked = False
+
+    def write(self, data):
+        written = super().write(data)
+        if self.tell() > self.maxSize:
+            raise PhotoRejected("The photo is larger than %d MB." % (self.maxSize // 2 ** 20))
+        if not self.checked and self.tell() >= SIGNATURE_LENGTH:
+            checkSignature(self.getbuffer()[:SIGNATURE_LENGTH].tobytes())
+            self.checked = True
+        return written
+
+
+def checkSignature(header):
+    """
+    Raises PhotoRejected unless the bytes start like a PNG or a JPEG file.
+    """
+    if not header.startswith(SIGNATURES):
+        raise PhotoRejected("The photo is not a PNG or JPEG image.")
+
+
+def checkPhoto(data):
+    """
+    Checks an upload's signature and, reading only its header, its size in pixels. Raises PhotoRejected.
+    """
+    checkSignature(data[:SIGNATURE_LENGTH])
+    try:
+        with Image.open(io.BytesIO(data)) as photo:
+            format, pixels = photo.format, photo.width * photo.height
+    except Image.DecompressionBombError:
+        format, pixels = None, Image.MAX_IMAGE_PIXELS * 2 + 1
+    except (OSError, SyntaxError):
+        raise PhotoRejected("The photo could not be read.")
+    limit = MAX_PIXELS.get(format, DEFAULT_MAX_PIXELS)
+    if pixels > limit:
+        raise PhotoRejected("The photo has more than %d megapixels." % (limit // 1000000))
+
+
+# Number of photos processed at the same time.
+workers = 2
+
+# Number of finished jobs kept around for the admin page.
+history = 50
+
+_executor = None
+_executor_lock = threading.Lock()
+_jobs = collections.OrderedDict()
+_jobs_lock = threading.Lock()
+
+# Callables run with the job after a photo has been written, e.g. to drop cached pages.
+on_complete = []
+
+# Callables run with every job once it has finished, successfully or not (its status says which).
+on_finish = []
+
+
+def configure(workerCount):
+    """
+    Sets the size of the worker pool. Takes effect for a pool that has not been started yet.
+    """
+    global workers
+    workers = workerCount
+
+
+def getExecutor():
+    """
+    Returns the worker pool, starting it on first use.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photo")
+    return _executor
+
+
+def photoName(data, filename):
+    """
+    Returns the name a photo is stored under: the hash of its bytes and .png for PNG uploads, .jpg otherwise.
+    """
+    extension = ".png" if os.path.splitext(filename)[1].lower() == ".png" else ".jpg"
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH] + extension
+
+
+def isContentAddressed(name):
+    """
+    Tells whether a file name is that of a photo stored by storePhoto(), or of one of its variants.
+    """
+    return HASHED_NAME.match(name) is not None
+
+
+def storePhoto(data, directory, filename):
+    """
+    Queues the photo to be processed into directory under photoName(), unless an identical upload is stored
+    there already or is being processed. filename is the uploaded file's name, used for its extension.
+    Returns the stored name and the job (see submitBytes), or None when nothing had to be queued. Raises PhotoRejected.
+    """
+    checkPhoto(data)
+    name = photoName(data, filename)
+    destination = os.path.join(directory, name)
+    folder = os.path.basename(directory.rstrip(os.sep))
+    with _jobs_lock:
+        pending = any(job["file"] == name and job["folder"] == folder and job["status"] in ("queued", "processing") for job in _jobs.values())
+    if pending:
+        return name, None
+    if os.path.exists(destination):
+        # Mark the file as in use again, so a garbage collection running right now leaves it alone.
+        os.utime(destination)
+        return name, None
+    return name, submitBytes(data, destination)
+
+
+def submitBytes(data, destination):
+    """
+    Queues image bytes to be processed and saved at destination. Returns the job, whose status the worker
+    updates; it stays valid after the job has dropped out of the history recentJobs() shows.
+    """
+    job = {
+        "id": uuid.uuid4().hex,
+        "file": os.path.basename(destination),
+        "folder": os.path.basename(os.path.dirname(destination)),
+        "status": "queued",
+        "error": "",
+        "submitted": datetime.datetime.now().isoformat(timespec="seconds"),
+        "finished": "",
+        "seconds": None,
+    }
+    with _jobs_lock:
+        _jobs[job["id"]] = job
+        while len(_jobs) > history and next(iter(_jobs.values()))["status"] in ("done", "failed"):
+            _jobs.popitem(last=False)
+
+    getExecutor().submit(_run, job, data, destination)
+    return job
+
+
+def _run(job, data, destination):
+    job["status"] = "processing"
+    started = time.perf_counter()
+    try:
+        processPhoto(data, destination)
+    except Exception as error:
+        job["status"] = "failed"
+        job["error"] = str(error)
+    else:
+        job["status"] = "done"
+    job["seconds"] = round(time.perf_counter() - started, 3)
+    job["finished"] = datetime.datetime.now().isoformat(timespec="seconds")
+    for callback in on_finish:
+        callback(job)
+    if job["status"] == "done":
+        for callback in on_complete:
+            callback(job)
+
+
+def processPhoto(data, destination):
+    """
+    Decodes the image bytes, center-crops and resizes them to a PHOTO_SIZE square and writes the result.
+    The file is written under a temporary name and moved into place, so readers never see half a photo.
+    """
+    with Image.open(io.BytesIO(data)) as photo:
+        photo = squarePhoto(photo)
+
+    savePhoto(photo, destination)
+    writeVariants(photo, destination)
+
+
+def savePhoto(photo, destination, format=None, options=None):
+    """
+    Encodes the image and moves it into place. Without a format, the destination's extension picks JPEG or PNG.
+    """
+    if format is None:
+        format, options = photoFormat(destination)
+    if format == "JPEG":
+        photo = photo.convert("RGB")
+
+    temporary = destination + ".part"
+    photo.save(temporary, format=format, **(options or {}))
+    os.replace(temporary, destination)
+
+
+def squarePhoto(photo, size=PHOTO_SIZE):
+    """
+    Applies the EXIF orientation, then center-crops and resizes the image to a size x size square.
+    """
+    # Let the JPEG decoder downscale by a power of two first, when the photo is much larger than needed.
+    photo.draft("RGB", (size, size))
+    photo = ImageOps.exif_transpose(photo)
+    return ImageOps.fit(photo, (size, size), method=Image.LANCZOS)
+
+
+def variantPath(destination, width, extension):
+    """
+    Returns where the variant of the photo at destination with the given width and extension is stored.
+    """
+    directory, filename = os.path.split(destination)
+    stem, original = os.path.splitext(filename)
+    return os.path.join(directory, VARIANT_DIRECTORY, "%s_%s-%d.%s" % (stem, original.lstrip(".").lower(), width, extension))
+
+
+def fallbackExtension(photo):
+    """
+    Returns the extension of the legacy-format variants: PNG when the photo has transparency, JPEG otherwise.
+    """
+    return "png" if "A" in photo.getbands() or "transparency" in photo.info else "jpg"
+
+
+def writeVariants(photo, destination):
+    """
+    Writes the resized variants of a square photo for the widths configured for its directory.
+    Widths larger than the photo itself are skipped.
+    """
+    folder = os.path.basename(os.path.dirname(destination))
+    os.makedirs(os.path.join(os.path.dirname(destination), VARIANT_DIRECTORY), exist_ok=True)
+    fallback = fallbackExtension(photo)
+    if photo.mode not in ("RGB", "RGBA"):
+        photo = photo.convert("RGBA" if fallback == "png" else "RGB")
+
+    for width in VARIANT_WIDTHS.get(folder, ()):
+        if width > photo.width:
+            continue
+        variant = photo.resize((width, width), Image.LANCZOS)
+        for format, extension, mime, options in MODERN_FORMATS:
+            savePhoto(variant, variantPath(destination, width, extension), format, options)
+        savePhoto(variant, variantPath(destination, width, fallback))
+
+
+def variantSources(destination, url):
+    """
+    Lists the variants that exist on disk for the photo at destination, whose public URL is url.
+    Returns None when there are none, otherwise a dict with the fallback srcset and a list of
+    {"type", "srcset"} alternates for <source> elements, best format first.
+    """
+    directory, filename = os.path.split(destination)
+    stem, original = os.path.splitext(filename)
+    pattern = os.path.join(directory, VARIANT_DIRECTORY, glob.escape("%s_%s-" % (stem, original.lstrip(".").lower())) + "*.*")
+    found = {}
+    for path in glob.glob(pattern):
+        width, extension = os.path.basename(path).rsplit("-", 1)[1].split(".", 1)
+        if width.isdigit():
+            found.setdefault(extension, []).append(int(width))
+    if not found:
+        return None
+
+    base = url.rsplit("/", 1)[0] + "/" + VARIANT_DIRECTORY + "/"
+
+    def srcset(extension):
+        return ", ".join("%s%s %dw" % (base, os.path.basename(variantPath(destination, width, extension)), width)
+                         for width in sorted(found[extension]))
+
+    fallback = "png" if "png" in found else "jpg"
+    return {
+        "srcset": srcset(fallback) if fallback in found else "",
+        "alternates": [{"type": mime, "srcset": srcset(extension)} for format, extension, mime, options in MODERN_FORMATS if extension in found],
+    }
+
+
+def variantsVersion(directory):
+    """
+    Returns the modification time, in nanoseconds, of the variants directory of the photos in directory, or 0.
+    It changes whenever a variant is written or removed, by any process, so pages that list variants can tell
+    they are out of date.
+    """
+    try:
+        return os.stat(os.path.join(directory, VARIANT_DIRECTORY)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def collectGarbage(directory, referenced, minAge=3600, dryRun=False):
+    """
+    Removes the photos in directory whose names are not in referenced, their variants, and leftover .part files.
+    Files changed within the last minAge seconds are kept, as they may belong to an upload whose profile has not
+    been saved yet. Returns the paths removed, or with dryRun the paths that would be.
+    """
+    stems = {"%s_%s" % (stem, extension.lstrip(".").lower()) for stem, extension in map(os.path.splitext, referenced)}
+    cutoff = time.time() - minAge
+    removed = []
+    for folder in (directory, os.path.join(directory, VARIANT_DIRECTORY)):
+        if not os.path.isdir(folder):
+            continue
+        for entry in os.scandir(folder):
+            if not entry.is_file() or entry.stat().st_mtime > cutoff:
+                continue
+            if entry.name.endswith(".part"):
+                used = False
+            elif folder == directory:
+                used = entry.name in referenced
+            else:
+                used = entry.name.rsplit("-", 1)[0] in stems
+            if not used:
+                if not dryRun:
+                    os.remove(entry.path)
+                removed.append(entry.path)
+    return removed
+
+
+def photoFormat(path):
+    """
+    Returns the format and save options of a stored photo from its extension: JPEG, or PNG for .png.
+    """
+    if os.path.splitext(path)[1].lower() in (".jpg", ".jpeg"):
+        return "JPEG", {"quality": 85, "optimize": True, "progressive": True}
+    return "PNG", {"optimize": True}
+
+
+def backfillVariants(directory, resizeOriginals=False):
+    """
+    Writes variants for every photo already in directory. With resizeOriginals, photos that are not
+    PHOTO_SIZE squares are also cropped and resized first: in place for photos with their upload name, and
+    under the hash of the resized bytes for content-addressed ones, which must never change under their name.
+    Returns the number of photos processed and {old name: new name} for the photos that were renamed; the
+    profiles referring to them have to be updated, and the old files are left to collectGarbage().
+    """
+    count = 0
+    renamed = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path) or os.path.splitext(name)[1].lower() not in (".png", ".jpg", ".jpeg"):
+            continue
+        with Image.open(path) as photo:
+            photo.load()
+            if resizeOriginals and photo.size != (PHOTO_SIZE, PHOTO_SIZE):
+                photo = squarePhoto(photo)
+                if isContentAddressed(name):
+                    resized = path + ".resized"
+                    savePhoto(photo, resized, *photoFormat(path))
+                    with open(resized, "rb") as file:
+                        renamed[name] = photoName(file.read(), name)
+                    path = os.path.join(directory, renamed[name])
+                    os.replace(resized, path)
+                else:
+                    savePhoto(photo, path)
+            elif photo.width != photo.height:
+                photo = squarePhoto(photo, min(photo.size))
+        writeVariants(photo, path)
+        count += 1
+    return count, renamed
+
+
+# Width, in pixels, of the background images served to each device class. 828 covers a phone at 2x.
+HERO_WIDTHS = {"mobile": 828, "desktop": 1920}
+HERO_DIRECTORY = "hero"
+HERO_MANIFEST = "heroes.json"
+
+# Width of the blurred placeholder inlined into the page while the full background loads.
+PLACEHOLDER_WIDTH = 32
+
+
+def placeholderDataUri(photo):
+    """
+    Returns a tiny, blurred JPEG of the image as a data: URI (typically well under 1 KB).
+    """
+    height = max(1, round(photo.height * PLACEHOLDER_WIDTH / photo.width))
+    small = photo.convert("RGB").resize((PLACEHOLDER_WIDTH, height), Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    small.save(buffer, format="JPEG", quality=40)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def buildHeroes(imagesFolder):
+    """
+    Writes device-sized progressive JPEG and WebP copies of the background images directly in imagesFolder
+    to imagesFolder/hero, plus a manifest with their paths and placeholders. Images whose copies are newer
+    than the source are skipped. Returns the manifest, keyed by the source file name.
+    """
+    outputFolder = os.path.join(imagesFolder, HERO_DIRECTORY)
+    os.makedirs(outputFolder, exist_ok=True)
+    manifest = loadHeroes(imagesFolder)
+
+    for name in sorted(os.listdir(imagesFolder)):
+        source = os.path.join(imagesFolder, name)
+        stem, extension = os.path.splitext(name)
+        if not os.path.isfile(source) or extension.lower() not in (".png", ".jpg", ".jpeg"):
+            continue
+
+        outputs = {device: "%s-%d" % (stem, width) for device, width in HERO_WIDTHS.items()}
+        newest = [os.path.join(outputFolder, output + ".webp") for output in outputs.values()]
+        if name in manifest and all(os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source) for path in newest):
+            continue
+
+        with Image.open(source) as photo:
+            widest = max(HERO_WIDTHS.values())
+            photo.draft("RGB", (widest, widest * photo.height // photo.width))
+            photo = photo.convert("RGB")
+
+        entry = {"placeholder": placeholderDataUri(photo)}
+        for device, width in HERO_WIDTHS.items():
+            width = min(width, photo.width)
+            resized = photo.resize((width, round(photo.height * width / photo.width)), Image.LANCZOS)
+            savePhoto(resized, os.path.join(outputFolder, outputs[device] + ".jpg"), "JPEG", {"quality": 80, "optimize": True, "progressive": True})
+            savePhoto(resized, os.path.join(outputFolder, outputs[device] + ".webp"), "WEBP", {"quality": 75, "method": 6})
+            entry[device] = "images/%s/%s" % (HERO_DIRECTORY, outputs[device])
+        manifest[name] = entry
+
+    manifestPath = os.path.join(outputFolder, HERO_MANIFEST)
+    with open(manifestPath + ".part", "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(manifestPath + ".part", manifestPath)
+    return manifest
+
+
+def loadHeroes(imagesFolder):
+    """
+    Returns the background image manifest written by buildHeroes, or an empty dict if there is none.
+    """
+    try:
+        with open(os.path.join(imagesFolder, HERO_DIRECTORY, HERO_MANIFEST)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def waitForJobs(jobs, interval=0.05, timeout=None):
+    """
+    Blocks until the given jobs (as submitBytes() returned them) have finished. Returns copies of them, in
+    order. Raises TimeoutError when they have not all finished within timeout seconds.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while any(job["status"] not in ("done", "failed") for job in jobs):
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("%d photo jobs still unfinished" % sum(job["status"] not in ("done", "failed") for job in jobs))
+        time.sleep(interval)
+    return [dict(job) for job in jobs]
+
+
+def recentJobs():
+    """
+    Returns the tracked jobs, newest first.
+    """
+    with _jobs_lock:
+        return [dict(job) for job in reversed(_jobs.values())]
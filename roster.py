@@ -0,0 +1,89 @@
+import collections
+import threading
+
+import database
+
+"""
+    In-memory read model of the profiles.
+
+    The public pages read the faculty, JPL researchers and students from an immutable snapshot instead of
+    querying SQLite: named tuples (which carry no per-instance dict) already grouped the way the pages show
+    them. Readers take the current snapshot with current(), which is a plain attribute read plus the cheap
+    table version check below, and never lock.
+
+    A snapshot belongs to the table versions it was loaded from (database.tableVersions(), which only goes
+    back to the data_version table when PRAGMA data_version says another connection has committed). When
+    they change, whether through this worker's admin forms or any other process, the next reader builds a
+    new snapshot, reloading only the tables that changed and sharing the rest with the old one, and swaps
+    it in with a single assignment. Requests still holding the old snapshot finish with it undisturbed.
+"""
+
+Faculty = collections.namedtuple("Faculty", "FID name title school email bio image link role")
+Researcher = collections.namedtuple("Researcher", "RID name title location email bio image")
+Student = collections.namedtuple("Student", "SID name student_tier image school email")
+
+# faculty_by_role maps the lower-cased role to its members and students_by_school each school to its students,
+# each group in FID/SID order like the tables. The dicts are never changed once the snapshot is built.
+Snapshot = collections.namedtuple("Snapshot", "path versions faculty jpl students faculty_by_role students_by_school")
+
+# Table, record type and key of each part of the snapshot.
+TABLES = (("faculty", Faculty, "FID"), ("jpl", Researcher, "RID"), ("students", Student, "SID"))
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def current():
+    """
+    Returns the snapshot of the current table versions, building it first if they changed.
+    """
+    versions = database.tableVersions()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.versions != versions or snapshot.path != database.db_path:
+        snapshot = refresh()
+    return snapshot
+
+
+def refresh():
+    """
+    Builds the snapshot of the tables as they are now and swaps it in. Tables whose version did not change
+    are shared with the previous snapshot. Returns the new snapshot.
+    """
+    global _snapshot
+    with _lock:
+        previous = _snapshot
+        # Versions are read before the rows: a write committed in between gets the snapshot reloaded by the next reader.
+        versions = database.tableVersions()
+        if previous is not None and previous.path != database.db_path:
+            previous = None
+        if previous is not None and previous.versions == versions:
+            return previous
+
+        tables = {}
+        for table, record, key in TABLES:
+            if previous is not None and previous.versions.get(table) == versions.get(table):
+                tables[table] = getattr(previous, table)
+            else:
+                tables[table] = tuple(map(record._make, database.query("SELECT * FROM %s ORDER BY %s" % (table, key))))
+
+        if previous is not None and tables["faculty"] is previous.faculty:
+            facultyByRole = previous.faculty_by_role
+        else:
+            facultyByRole = group(tables["faculty"], lambda member: (member.role or "").lower())
+        if previous is not None and tables["students"] is previous.students:
+            studentsBySchool = previous.students_by_school
+        else:
+            studentsBySchool = group(tables["students"], lambda student: student.school)
+
+        _snapshot = Snapshot(database.db_path, versions, tables["faculty"], tables["jpl"], tables["students"], facultyByRole, studentsBySchool)
+        return _snapshot
+
+
+def group(records, key):
+    """
+    Returns {key: tuple of records} keeping the order of records within each group.
+    """
+    groups = collections.defaultdict(list)
+    for record in records:
+        groups[key(record)].append(record)
+    return {name: tuple(members) for name, members in groups.items()}
@@ -0,0 +1,21 @@
+import os
+
+from flask_app import createApp
+
+"""
+    Production entry point.
+
+    Under gunicorn the settings come from gunicorn.conf.py:  gunicorn wsgi:app
+    Under waitress (also on Windows):                        python wsgi.py
+
+    The app is configured from IMPACT_* environment variables (see settings in flask_app.py).
+"""
+
+app = createApp()
+
+
+if __name__ == '__main__':
+    import waitress
+
+    host, _, port = os.environ.get("IMPACT_BIND", "127.0.0.1:8000").rpartition(":")
+    waitress.serve(app, host=host or "127.0.0.1", port=int(port), threads=int(os.environ.get("IMPACT_THREADS", 8)))